@@ -1,21 +1,26 @@
 import streamlit as st
 import os
-import json
-from datetime import datetime
+import logging
+import time
+import uuid
 from dotenv import load_dotenv
-from model import handle_query
+from conversation import HISTORY_TURNS
+from history import HISTORY_PAGE_SIZE, get_chat_history
+from model import add_sources_to_answer, get_query_service, warm_up
+import metrics
 
-def load_chat_history():
-    """Load chat history from JSON file"""
-    if os.path.exists("chat_history.json"):
-        with open("chat_history.json", "r") as file:
-            return json.load(file)
-    return []
+def get_session_id():
+    """Return this browser session's history id.
 
-def save_chat_history(chat_history):
-    """Save chat history to JSON file"""
-    with open("chat_history.json", "w") as file:
-        json.dump(chat_history, file)
+    It lives only in the session state, never in the URL, so a shared link
+    can't open someone else's questions; a new tab starts a new history.
+    """
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    if "session" in st.query_params:
+        # Links from versions that kept the id in the URL
+        del st.query_params["session"]
+    return st.session_state.session_id
 
 def format_response(response_data):
     """Format the response with Ayurvedic styling"""
@@ -31,11 +36,6 @@ def format_response(response_data):
     """
     return formatted_result
 
-def clear_chat_history():
-    """Clear the chat history file"""
-    if os.path.exists("chat_history.json"):
-        os.remove("chat_history.json")
-
 def load_css(file_name):
     """Load custom CSS styles"""
     if os.path.exists(file_name):
@@ -59,9 +59,21 @@ def main():
     
     # Load custom CSS
     load_css("style.css")
+
+    # Expose Prometheus metrics when a port is configured
+    if os.getenv("VEDABOT_METRICS_PORT"):
+        metrics.start_http_server(int(os.getenv("VEDABOT_METRICS_PORT")))
+
+    # Load the shared models and index once per process so the first question is fast
+    try:
+        warm_up()
+    except Exception as e:
+        logging.error(f"Error warming up the chatbot: {str(e)}")
     
-    # Load chat history
-    chat_history = load_chat_history()
+    # Load this session's most recent chat history
+    session_id = get_session_id()
+    history_pages = st.session_state.setdefault("history_pages", 1)
+    chat_history = get_chat_history().page(session_id, limit=HISTORY_PAGE_SIZE * history_pages)
 
     # Header section with logo and title
     st.markdown("""
@@ -101,8 +113,13 @@ def main():
                 question_display = chat.get('question', 'Question Not Available')
                 st.markdown(f"**{time_display}** - {question_display}")
 
+            if len(chat_history) == HISTORY_PAGE_SIZE * history_pages and st.button("Show older"):
+                st.session_state.history_pages += 1
+                st.rerun()
+
             if st.button("Clear Chat History"):
-                clear_chat_history()
+                get_chat_history().clear(session_id)
+                st.session_state.history_pages = 1
                 st.success("Chat History has been cleared.")
 
     # Main content layout
@@ -117,20 +134,39 @@ def main():
         )
 
         if st.button("Submit", key="submit_button", help="Click to get Ayurvedic insights") and question.strip():
+            response_data = {}
+            placeholder = st.empty()
+            # Earlier turns of this session, oldest first, for follow-up questions
+            memory = [turn for turn in reversed(get_chat_history().page(session_id, limit=HISTORY_TURNS))
+                      if turn.get("answer")]
             with st.spinner("Finding the best Ayurvedic insights..."):
-                response_data = handle_query(question)
-                
+                tokens = get_query_service().stream(question, response_data, history=memory)
+                # Keep the spinner up until the first token arrives
+                answer = next(tokens, "")
+
+            last_render = 0.0
+            for token in tokens:
+                answer += token
+                # Re-render at most ~20 times a second rather than per token
+                if time.monotonic() - last_render > 0.05:
+                    placeholder.markdown(format_response({"result": answer}), unsafe_allow_html=True)
+                    last_render = time.monotonic()
+
             if response_data:
-                formatted_response = format_response(response_data)
-                st.markdown(formatted_response, unsafe_allow_html=True)
+                answer = add_sources_to_answer(response_data.get("source_documents", []), response_data["result"])
+                formatted_response = format_response({"result": answer})
+                placeholder.markdown(formatted_response, unsafe_allow_html=True)
+                if response_data.get("route") == "extractive":
+                    st.caption("Quoted directly from the pharmacopoeia monograph")
+                if response_data.get("trace_id"):
+                    st.caption(f"Request ID: {response_data['trace_id']}")
                 
-                # Save to chat history
-                chat_entry = {
-                    "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "question": question
-                }
-                chat_history.append(chat_entry)
-                save_chat_history(chat_history)
+                # Save to chat history; a failed answer is kept out of the memory follow-ups are prompted with
+                failed = response_data.get("route") in ("error", "rejected")
+                try:
+                    get_chat_history().append(session_id, question, None if failed else response_data.get("result"))
+                except Exception as e:
+                    logging.error(f"Error saving chat history: {str(e)}")
             else:
                 st.warning("No relevant insights found. Please refine your query.")
     
@@ -0,0 +1,144 @@
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import model
+
+BATCH_CONCURRENCY = 4  # LLM calls in flight at once
+
+def read_questions(path):
+    """Read {"question": ..., "id": ...} lines; lines without an id are numbered"""
+    questions = []
+    with open(path) as file:
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            entry.setdefault("id", str(number))
+            questions.append(entry)
+    return questions
+
+def completed_ids(path):
+    """Ids already answered in an earlier, possibly interrupted, run"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path) as file:
+        for line in file:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a line cut off by the interruption
+            if "error" not in entry:
+                done.add(entry["id"])
+    return done
+
+def answer_one(registry, entry, docs):
+    # Retries, hedging and failover happen inside the LLM layer (llm_backends.ResilientLLM)
+    start = time.perf_counter()
+    try:
+        prompt = model.build_prompt(registry, entry["question"], entry["question"], docs)
+        result = {"answer": registry["llm"].invoke(prompt)}
+    except Exception as e:
+        logging.error(f"Error answering {entry['id']}: {str(e)}")
+        result = {"error": str(e)}
+    result["generate_seconds"] = time.perf_counter() - start
+    return result
+
+def _end_line(output):
+    """Don't append onto a line cut off by an interruption"""
+    if output.tell():
+        output.seek(output.tell() - 1)
+        if output.read(1) != "\n":
+            output.write("\n")
+
+def _record(entry, result, route):
+    return {
+        "id": entry["id"],
+        "question": entry["question"],
+        "answer": result.get("answer", result.get("result")),
+        "route": route,
+        "sources": [
+            {"source": os.path.basename(doc.metadata.get("source", "")), "page": doc.metadata.get("page")}
+            for doc in result.get("source_documents", [])
+        ],
+        "timings": {"generate": result["generate_seconds"]},
+    }
+
+def run_batch(input_path, output_path, concurrency=BATCH_CONCURRENCY, k=model.RETRIEVAL_K, filter=None):
+    """Answer every question in input_path, appending results to output_path as they finish.
+
+    Questions already answered in output_path are skipped, so an interrupted
+    run picks up where it stopped; failed ones are retried and get a new
+    line. Plain herb lookups are answered from the monograph sections
+    without the LLM; the other questions are embedded in one call and
+    searched with one FAISS query per shard, and only the LLM calls run per
+    question.
+    """
+    done = completed_ids(output_path)
+    pending = [entry for entry in read_questions(input_path) if entry["id"] not in done]
+    if done:
+        logging.info(f"Skipping {len(done)} questions already answered in {output_path}")
+    if not pending:
+        return {"answered": 0, "failed": 0, "skipped": len(done)}
+
+    registry, _ = model._load_registry()
+    direct = {}
+    for entry in pending:
+        start = time.perf_counter()
+        response = model.answer_directly(registry, entry["question"], filter)
+        if response is not None:
+            direct[entry["id"]] = dict(response, generate_seconds=time.perf_counter() - start)
+    if direct:
+        logging.info(f"Answered {len(direct)} lookups without the LLM")
+    answered = 0
+    with open(output_path, "a+") as output:
+        _end_line(output)
+        for entry in pending:
+            if entry["id"] in direct:
+                output.write(json.dumps(_record(entry, direct[entry["id"]], "extractive")) + "\n")
+                answered += 1
+    pending = [entry for entry in pending if entry["id"] not in direct]
+    if not pending:
+        return {"answered": answered, "failed": 0, "skipped": len(done)}
+
+    questions = [entry["question"] for entry in pending]
+    start = time.perf_counter()
+    embeddings = registry["embeddings"].embed_documents(questions)
+    embed_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    retrieved = model.search_chunks_batch(registry, questions, embeddings, k, filter=filter)
+    search_seconds = time.perf_counter() - start
+    logging.info(f"Embedded and searched {len(pending)} questions in {embed_seconds + search_seconds:.2f}s")
+
+    failed = 0
+    with open(output_path, "a+") as output, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {
+            executor.submit(answer_one, registry, entry, docs): (entry, docs)
+            for entry, docs in zip(pending, retrieved)
+        }
+        for future in as_completed(futures):
+            entry, docs = futures[future]
+            result = dict(future.result(), source_documents=docs)
+            record = _record(entry, result, "llm")
+            record["timings"].update(embed=embed_seconds / len(pending), search=search_seconds / len(pending))
+            if "error" in result:
+                record["error"] = result["error"]
+                failed += 1
+            else:
+                answered += 1
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+    return {"answered": answered, "failed": failed, "skipped": len(done)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions in bulk")
+    parser.add_argument("input", help="JSONL with one {\"question\": ..., \"id\": ...} per line")
+    parser.add_argument("--output", default="answers.jsonl", help="JSONL results, appended to and resumed from")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--k", type=int, default=model.RETRIEVAL_K)
+    parser.add_argument("--filter", type=json.loads, help='restrict retrieval by chunk metadata, e.g. \'{"volume": "API-Vol-1"}\'')
+    args = parser.parse_args()
+    print(json.dumps(run_batch(args.input, args.output, args.concurrency, args.k, args.filter)))
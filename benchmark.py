@@ -0,0 +1,195 @@
+import argparse
+import json
+import logging
+import os
+import random
+import resource
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from langchain_core.language_models.llms import LLM
+from cache import AnswerCache
+import ingest
+import model
+from store import CHUNKS_FILE, list_shards
+
+REPO_DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ingest.DATA_PATH)
+
+class StubLLM(LLM):
+    """Local stand-in for HuggingFaceEndpoint with a fixed generation delay"""
+
+    latency_ms: float = 0.0
+
+    @property
+    def _llm_type(self):
+        return "stub"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency_ms / 1000)
+        return "Stub answer."
+
+def percentiles(values):
+    """Return p50/p90/p99 and mean of a list of seconds, in milliseconds"""
+    if not values:
+        return {}
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return {"p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99), "mean": sum(ordered) / len(ordered) * 1000}
+
+def peak_memory_mb():
+    """Peak resident memory of this process and of its finished children"""
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale,
+    }
+
+def sample_questions(count, seed=0):
+    """Build a labeled question set from the indexed chunks.
+
+    Each question is a 12-word window from a random chunk, labeled with the
+    chunk's file and page, so recall@k measures whether retrieval finds the
+    page a passage came from.
+    """
+    rows = []
+    for folder in list_shards(ingest.DB_FAISS_PATH).values():
+        with sqlite3.connect(os.path.join(folder, CHUNKS_FILE)) as connection:
+            rows += connection.execute("SELECT text, metadata FROM chunks").fetchall()
+    rng = random.Random(seed)
+    questions = []
+    for text, metadata in rng.sample(rows, min(count * 3, len(rows))):
+        words = text.split()
+        if len(words) < 20:
+            continue
+        start = rng.randrange(len(words) - 12)
+        metadata = json.loads(metadata)
+        questions.append({
+            "question": " ".join(words[start:start + 12]),
+            "source": os.path.basename(metadata["source"]),
+            "page": metadata.get("page"),
+        })
+        if len(questions) == count:
+            break
+    return questions
+
+def is_hit(doc, label):
+    if os.path.basename(doc.metadata.get("source", "")) != label["source"]:
+        return False
+    return label.get("page") is None or doc.metadata.get("page") == label["page"]
+
+def run_queries(questions, llm_latency_ms):
+    """Answer each question through handle_query with the stub LLM and measure recall@k.
+
+    Stage latencies come from each response's trace timings, so they cover
+    the same spans (condense, embed, search, generate…) as a real query.
+    """
+    llm = StubLLM(latency_ms=llm_latency_ms)
+    stages, routes = defaultdict(list), defaultdict(int)
+    hits = 0
+    # Swapped only for the run: the stub LLM, and an answer cache in the scratch directory so the
+    # benchmark's index doesn't clear the real one
+    load_llm, model.load_llm = model.load_llm, lambda: llm
+    cache = model.answer_cache
+    model.answer_cache = AnswerCache(model.ANSWER_CACHE_PATH, threshold=cache.threshold, ttl=cache.ttl,
+                                     max_entries=cache.max_entries)
+    try:
+        start = time.perf_counter()
+        registry, _ = model._load_registry()
+        load_seconds = time.perf_counter() - start
+        registry["llm"] = llm  # the registry may have been warm already
+        for label in questions:
+            start = time.perf_counter()
+            response = model.handle_query(label["question"])
+            stages["total"].append(time.perf_counter() - start)
+            for stage, seconds in response["timings"].items():
+                stages[stage].append(seconds)
+            routes[response["route"]] += 1
+            hits += any(is_hit(doc, label) for doc in response.get("source_documents", []))
+    finally:
+        model.load_llm, model.answer_cache = load_llm, cache
+
+    return {
+        "chain_load_seconds": load_seconds,
+        "latency_ms": {stage: percentiles(values) for stage, values in stages.items()},
+        "routes": dict(routes),
+        "recall_at_k": hits / len(questions) if questions else None,
+        "k": model.RETRIEVAL_K,
+        "questions": len(questions),
+    }
+
+def run_benchmark(files, questions_path, num_questions, index_type, llm_latency_ms, keep=False):
+    """Ingest the given PDFs into a scratch directory and benchmark queries against them.
+
+    The scratch directory is removed afterwards unless keep is set.
+    """
+    workdir = tempfile.mkdtemp(prefix="vedabot-bench-")
+    cwd = os.getcwd()
+    try:
+        results = _run_in(workdir, files, questions_path, num_questions, index_type, llm_latency_ms)
+    finally:
+        os.chdir(cwd)
+        if not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    if keep:
+        results["workdir"] = workdir
+    return results
+
+def _run_in(workdir, files, questions_path, num_questions, index_type, llm_latency_ms):
+    os.makedirs(os.path.join(workdir, ingest.DATA_PATH))
+    for name in files:
+        os.symlink(os.path.join(REPO_DATA_PATH, name), os.path.join(workdir, ingest.DATA_PATH, name))
+    os.chdir(workdir)
+
+    start = time.perf_counter()
+    stats = ingest.create_vector_db(incremental=False, index_type=index_type) or {}
+    build_seconds = time.perf_counter() - start
+    index_bytes = sum(
+        os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(ingest.DB_FAISS_PATH) for name in names
+    )
+    embed_seconds = stats.get("seconds") or float("nan")
+
+    if questions_path:
+        with open(questions_path) as file:
+            questions = [json.loads(line) for line in file if line.strip()]
+    else:
+        questions = sample_questions(num_questions)
+
+    return {
+        "files": len(files),
+        "index_type": index_type,
+        "ingest": {
+            "pages": stats.get("pages", 0),
+            "chunks": stats.get("chunks", 0),
+            "pages_per_s": stats.get("pages", 0) / embed_seconds,
+            "chunks_per_s": stats.get("chunks", 0) / embed_seconds,
+            "build_seconds": build_seconds,
+            "index_bytes": index_bytes,
+        },
+        "query": run_queries(questions, llm_latency_ms),
+        "peak_memory_mb": peak_memory_mb(),
+    }
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.WARNING)
+    parser = argparse.ArgumentParser(description="Benchmark ingest and query latency offline with a stub LLM")
+    parser.add_argument("--files", nargs="*", help="PDFs from data/ to ingest (default: all)")
+    parser.add_argument("--questions", help="JSONL of {question, source, page} labels (default: sampled from the corpus)")
+    parser.add_argument("--num-questions", type=int, default=100)
+    parser.add_argument("--index", choices=ingest.INDEX_TYPES, default="flat")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="simulated generation time per query")
+    parser.add_argument("--output", help="also write the JSON results to this file")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory with the built index")
+    args = parser.parse_args()
+
+    files = args.files or sorted(name for name in os.listdir(REPO_DATA_PATH) if name.endswith(".pdf"))
+    questions_path = os.path.abspath(args.questions) if args.questions else None
+    output_path = os.path.abspath(args.output) if args.output else None
+    results = run_benchmark(files, questions_path, args.num_questions, args.index, args.llm_latency_ms, args.keep)
+    results["timestamp"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    print(json.dumps(results, indent=2))
+    if output_path:
+        with open(output_path, "w") as file:
+            json.dump(results, file, indent=2)
@@ -0,0 +1,100 @@
+import logging
+import math
+import re
+import sqlite3
+import time
+from collections import Counter
+import numpy as np
+
+K1 = 1.5
+B = 0.75
+
+STOPWORDS = frozenset("""
+a about an and are as at be been but by can do does for from has have how i if in into is it its
+me my no not of on or our should so than that the their them then there these they this to
+was we were what when where which while who why will with you your
+""".split())
+
+def tokenize(text):
+    """Split text into lower-case word tokens, dropping stopwords"""
+    return [token for token in re.findall(r"\w+", text.lower()) if token not in STOPWORDS]
+
+def write_postings(connection, chunks):
+    """Build the BM25 inverted index for (position, text) pairs into SQLite"""
+    connection.execute("CREATE TABLE postings (term TEXT, position INTEGER, tf INTEGER, "
+                       "PRIMARY KEY (term, position)) WITHOUT ROWID")
+    connection.execute("CREATE TABLE doc_lengths (position INTEGER PRIMARY KEY, length INTEGER)")
+    for position, text in chunks:
+        counts = Counter(tokenize(text))
+        connection.executemany(
+            "INSERT INTO postings VALUES (?, ?, ?)",
+            ((term, position, tf) for term, tf in counts.items()),
+        )
+        connection.execute("INSERT INTO doc_lengths VALUES (?, ?)", (position, sum(counts.values())))
+
+class BM25Index:
+    """BM25 search over the postings written by write_postings"""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._lengths = None
+
+    @classmethod
+    def load(cls, chunks):
+        """Return the index for a chunk store, or None if it has no postings"""
+        row = chunks.connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'postings'"
+        ).fetchone()
+        return cls(chunks) if row else None
+
+    def _doc_lengths(self):
+        if self._lengths is None:
+            rows = self._chunks.connection.execute("SELECT position, length FROM doc_lengths").fetchall()
+            lengths = np.zeros(max((position for position, _ in rows), default=-1) + 1, dtype=np.float32)
+            for position, length in rows:
+                lengths[position] = length
+            self._lengths = lengths
+        return self._lengths
+
+    def search(self, query, k, budget_ms=None):
+        """Return up to k (chunk id, score) pairs, best first.
+
+        With budget_ms set, the SQLite lookups are interrupted once the budget
+        is spent and the terms scored so far are used.
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        lengths = self._doc_lengths()
+        if not len(lengths):
+            return []
+        average_length = float(lengths.mean()) or 1.0
+        connection = self._chunks.connection
+        if budget_ms is not None:
+            deadline = time.perf_counter() + budget_ms / 1000
+            connection.set_progress_handler(lambda: time.perf_counter() > deadline, 1000)
+
+        scores = {}
+        try:
+            for term in terms:
+                rows = connection.execute("SELECT position, tf FROM postings WHERE term = ?", (term,)).fetchall()
+                if not rows:
+                    continue
+                idf = math.log(1 + (len(lengths) - len(rows) + 0.5) / (len(rows) + 0.5))
+                for position, tf in rows:
+                    norm = K1 * (1 - B + B * lengths[position] / average_length)
+                    scores[position] = scores.get(position, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+        except sqlite3.OperationalError:
+            logging.debug("BM25 search ran over its budget, using partial scores")
+        finally:
+            if budget_ms is not None:
+                connection.set_progress_handler(None, 1000)
+
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        if not best:
+            return []
+        ids = dict(connection.execute(
+            f"SELECT position, id FROM chunks WHERE position IN ({','.join('?' * len(best))})",
+            [position for position, _ in best],
+        ).fetchall())
+        return [(ids[position], score) for position, score in best if position in ids]
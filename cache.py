@@ -0,0 +1,157 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import numpy as np
+from langchain_core.documents import Document
+
+def normalize_question(question):
+    """Lower-case a question and strip punctuation and extra whitespace"""
+    return " ".join(re.findall(r"\w+", question.lower()))
+
+class AnswerCache:
+    """Persistent answer cache with exact and embedding-similarity lookup.
+
+    Entries are keyed by the normalized question; a miss on the key falls back
+    to the most similar cached question embedding above `threshold`. Entries
+    expire after `ttl` seconds and the least recently used ones are evicted
+    beyond `max_entries`. The cache is tied to an index signature and emptied
+    when the vector store it was built from changes.
+
+    Each entry is one row in SQLite, with its embedding as a float32 blob, so
+    storing an answer writes one row instead of the whole cache and several
+    processes can share the file. The embeddings are mirrored in memory for
+    the similarity search and topped up with rows other processes added.
+    """
+
+    def __init__(self, path, threshold=0.92, ttl=7 * 24 * 3600, max_entries=1000):
+        self.path = path
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._embeddings = {}  # key -> embedding of the rows seen so far
+        self._last_id = 0
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.connection as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries (id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT UNIQUE NOT NULL, "
+                "embedding BLOB NOT NULL, result TEXT NOT NULL, sources TEXT NOT NULL, created REAL NOT NULL, "
+                "used REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS entries_used ON entries (used)")
+            connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _refresh(self):
+        """Mirror the embeddings of rows added since the last refresh, by this or another process"""
+        rows = self.connection.execute(
+            "SELECT id, key, embedding FROM entries WHERE id > ? ORDER BY id", (self._last_id,)
+        ).fetchall()
+        for id, key, embedding in rows:
+            self._embeddings[key] = np.frombuffer(embedding, dtype=np.float32)
+            self._last_id = id
+        if len(self._embeddings) > self.max_entries:
+            # Other processes evicted rows this one still mirrors
+            self._prune()
+
+    def _prune(self):
+        """Drop mirrored embeddings whose rows were expired or evicted"""
+        alive = {key for (key,) in self.connection.execute("SELECT key FROM entries")}
+        for key in [key for key in self._embeddings if key not in alive]:
+            del self._embeddings[key]
+
+    def bind(self, signature):
+        """Attach the cache to an index signature, clearing it if the index changed"""
+        signature = json.dumps(signature, sort_keys=True)
+        with self._lock, self.connection as connection:
+            row = connection.execute("SELECT value FROM meta WHERE key = 'signature'").fetchone()
+            if row is not None and row[0] == signature:
+                return
+            if connection.execute("DELETE FROM entries").rowcount:
+                logging.info("Vector store changed, clearing answer cache")
+            connection.execute("INSERT OR REPLACE INTO meta VALUES ('signature', ?)", (signature,))
+            self._embeddings.clear()
+
+    def _candidates(self, key, embedding):
+        """Keys worth fetching for a question: the exact key, then similar questions, best first"""
+        if key in self._embeddings:
+            yield key, True
+        if not self._embeddings:
+            return
+        query = np.asarray(embedding, dtype=np.float32)
+        keys = list(self._embeddings)
+        matrix = np.stack([self._embeddings[k] for k in keys])
+        scores = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-12)
+        for i in np.argsort(-scores):
+            if scores[i] < self.threshold:
+                return
+            if keys[i] != key:
+                yield keys[i], False
+
+    def lookup(self, question, embedding):
+        """Return a cached response for the question, or None"""
+        key = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            self._refresh()
+            for candidate, exact in self._candidates(key, embedding):
+                row = self.connection.execute(
+                    "SELECT result, sources FROM entries WHERE key = ? AND created > ?", (candidate, now - self.ttl)
+                ).fetchone()
+                if row is None:
+                    # Expired, or evicted by another process
+                    self._embeddings.pop(candidate, None)
+                    continue
+                with self.connection as connection:
+                    connection.execute("UPDATE entries SET used = ? WHERE key = ?", (now, candidate))
+                self.stats["exact_hits" if exact else "semantic_hits"] += 1
+                result, sources = row
+                return {
+                    "query": question,
+                    "result": result,
+                    "source_documents": [Document(**source) for source in json.loads(sources)],
+                    "cached": True,
+                }
+            self.stats["misses"] += 1
+            return None
+
+    def store(self, question, embedding, response):
+        """Cache a response produced by the chain"""
+        key = normalize_question(question)
+        sources = [
+            {"page_content": doc.page_content, "metadata": doc.metadata}
+            for doc in response.get("source_documents", [])
+        ]
+        now = time.time()
+        with self.connection as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO entries (key, embedding, result, sources, created, used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, np.asarray(embedding, dtype=np.float32).tobytes(), response["result"], json.dumps(sources),
+                 now, now),
+            )
+            removed = connection.execute("DELETE FROM entries WHERE created <= ?", (now - self.ttl,)).rowcount
+            removed += connection.execute(
+                "DELETE FROM entries WHERE id NOT IN (SELECT id FROM entries ORDER BY used DESC LIMIT ?)",
+                (self.max_entries,),
+            ).rowcount
+        if removed:
+            with self._lock:
+                self._prune()
@@ -0,0 +1,172 @@
+import os
+import re
+import unicodedata
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+
+CHUNKER_VERSION = 2  # bump to force a full re-ingest when chunking changes
+CHUNK_SIZE = 1200  # characters; whole sections up to this size stay in one chunk
+CHUNK_OVERLAP = 50
+PLAIN_CHUNK_SIZE = 500  # for text outside monographs
+TITLE_LOOKAHEAD = 4  # lines after a title in which the monograph's opening sentence must appear
+
+# Headings of the pharmacopoeia monographs (single drugs) and formulations,
+# with the spelling variants found in the scanned volumes
+SECTIONS = [
+    ("SYNONYMS", r"SYNONYMS"),
+    ("REGIONAL LANGUAGE NAMES", r"REGIONAL\s+LAN\w*\s+NAMES"),
+    ("DEFINITION", r"DEFINITION"),
+    ("FORMULATION COMPOSITION", r"FORMULATION\s+COMPOSITION"),
+    ("METHOD OF PREPARATION", r"METHOD\s+OF\s+PREPARATION"),
+    ("DESCRIPTION", r"DESCRIPTION"),
+    ("IDENTIFICATION", r"IDENTIFICATION"),
+    ("IDENTITY, PURITY AND STRENGTH", r"IDENTITY,?\s+PURITY\s+AND\s+STREN\w*"),
+    ("PHYSICO-CHEMICAL PARAMETERS", r"PHYSICO-?\s?CHEMICAL\s+PARAMETERS"),
+    ("T.L.C.", r"T\.\s?L\.\s?C\.?"),
+    ("ASSAY", r"ASSAY"),
+    ("OTHER REQUIREMENTS", r"OTHER\s+REQUIREMENTS"),
+    ("CONSTITUENTS", r"CONSTITUENTS"),
+    ("PROPERTIES AND ACTION", r"PROPERTIES\s+AND\s+ACTIONS?"),
+    ("IMPORTANT FORMULATIONS", r"IMPORTANT\s+FORMULATIONS?"),
+    ("THERAPEUTIC USES", r"THERAPEUTIC\s+USES?"),
+    ("DOSE", r"DOSE"),
+    ("ANUPANA", r"ANUPANA"),
+    ("CONTRA-INDICATIONS", r"CONTRA-?\s?INDICATIONS?"),
+    ("PRECAUTIONS", r"PRECAUTIONS?"),
+    ("STORAGE", r"STORAGE"),
+]
+_SECTION_PATTERNS = [(name, re.compile(pattern + r"$", re.IGNORECASE)) for name, pattern in SECTIONS]
+_HEADING = re.compile(
+    r"^\s*(" + "|".join(pattern for _, pattern in SECTIONS) + r")\s*(?:[-–:]\s*(.*))?$", re.IGNORECASE
+)
+_PAGE_NUMBER = re.compile(r"^\s*(\d{1,4}|[IVXLC]{1,8})\s*$")
+_NUMBERED = re.compile(r"^\s*\d{1,3}\.\s+(.+?)\s*$")
+_OPENING = re.compile(r"\bconsists\s+of\b|\bis\s+an?\b", re.IGNORECASE)
+
+def herb_key(name):
+    """Normalize a monograph name for filtering, e.g. "Ashwagandha (Rt.)" -> "ashwagandha" """
+    name = re.sub(r"\(.*?\)", " ", name)
+    name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode()
+    return " ".join(re.findall(r"[a-z]+", name.lower()))
+
+def clean_name(name):
+    """Drop the symbol noise some volumes' fonts leave in extracted titles"""
+    name = "".join(char for char in name if char.isalpha() or char in " ().,'-")
+    return " ".join(name.split())
+
+def volume_name(source):
+    """Volume of the pharmacopoeia a PDF holds, e.g. "API-Vol-1" """
+    return os.path.splitext(os.path.basename(source))[0]
+
+def _section(line):
+    match = _HEADING.match(line)
+    if match is None:
+        return None
+    for name, pattern in _SECTION_PATTERNS:
+        if pattern.match(match.group(1).strip()):
+            return name, (match.group(2) or "").strip()
+    return None
+
+def _is_title(lines, i):
+    """A monograph title is an upper-case line followed shortly by "X consists of"/"X is a" """
+    title = _NUMBERED.sub(r"\1", lines[i]).strip()
+    letters = re.sub(r"\(.*?\)", "", title)
+    if not 3 <= len(title) <= 80 or not letters.strip() or not letters.isupper() or _section(title):
+        return False
+    return any(_OPENING.search(line) for line in lines[i + 1:i + 1 + TITLE_LOOKAHEAD])
+
+def _clean_lines(page):
+    lines = [line.rstrip() for line in page.page_content.splitlines()]
+    lines = [line for line in lines if line.strip()]
+    # Running page numbers (arabic at the foot, roman in the front matter)
+    while lines and _PAGE_NUMBER.match(lines[-1]):
+        lines.pop()
+    while lines and _PAGE_NUMBER.match(lines[0]):
+        lines.pop(0)
+    return lines
+
+def _sections(pages):
+    """Split pages into (monograph, section, page, text) units"""
+    units = []
+    monograph, section, page, buffer = None, None, None, []
+
+    def flush():
+        if buffer:
+            units.append((monograph, section, page, "\n".join(buffer)))
+            buffer.clear()
+
+    for document in pages:
+        lines = _clean_lines(document)
+        number = document.metadata.get("page")
+        if monograph is None:
+            flush()  # text outside monographs is chunked page by page
+        for i, line in enumerate(lines):
+            if _is_title(lines, i):
+                name = clean_name(_NUMBERED.sub(r"\1", line))
+                # Some volumes print a plain transliteration ("5. Aragavadha (Frt.Pulp)") above the title
+                previous = _NUMBERED.match(lines[i - 1]) if i else None
+                if previous and not lines[i - 1].isupper():
+                    name = clean_name(previous.group(1))
+                    if buffer and buffer[-1] == lines[i - 1]:
+                        buffer.pop()
+                flush()
+                monograph, section, page = name, None, number
+                continue
+            heading = _section(line) if monograph is not None else None
+            if heading is not None:
+                flush()
+                section = heading[0]
+                line = f"{heading[0]}: {heading[1]}" if heading[1] else heading[0]
+            if not buffer:
+                page = number
+            buffer.append(line)
+    flush()
+    return units
+
+def monograph_sections(pages):
+    """Return the (monograph, section, page, text) of every headed monograph section"""
+    return [unit for unit in _sections(pages) if unit[0] is not None and unit[1] is not None]
+
+def chunk_pages(pages):
+    """Split a PDF's pages into chunks that follow its monograph structure.
+
+    Consecutive sections of a monograph are packed together up to
+    CHUNK_SIZE characters, so a short section such as DOSE stays whole and
+    shares a chunk with its neighbours; only sections longer than that are
+    split. Every chunk of a monograph starts with its name and carries page,
+    volume, herb, monograph and section metadata. Text outside monographs,
+    and PDFs without any, are split page by page as before.
+    """
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    plain_splitter = RecursiveCharacterTextSplitter(chunk_size=PLAIN_CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    chunks = []
+    source = pages[0].metadata.get("source", "") if pages else ""
+    base = {"source": source, "volume": volume_name(source)}
+
+    def emit(monograph, sections, page, text):
+        metadata = dict(base, page=page)
+        if monograph is not None:
+            metadata.update(herb=herb_key(monograph), monograph=monograph,
+                            section=", ".join(dict.fromkeys(section for section in sections if section)))
+            text = f"{monograph}\n{text}"
+        chunks.append(Document(page_content=text, metadata=metadata))
+
+    packed = None  # (monograph, sections, page, text) being filled
+    for monograph, section, page, text in _sections(pages):
+        if packed is not None and (packed[0] != monograph or monograph is None
+                                   or len(packed[3]) + 1 + len(text) > CHUNK_SIZE):
+            emit(*packed)
+            packed = None
+        if monograph is None:
+            for part in plain_splitter.split_text(text):
+                emit(None, [], page, part)
+        elif len(text) > CHUNK_SIZE:
+            for part in splitter.split_text(text):
+                emit(monograph, [section], page, part)
+        elif packed is None:
+            packed = (monograph, [section], page, text)
+        else:
+            packed = (monograph, packed[1] + [section], packed[2], packed[3] + "\n" + text)
+    if packed is not None:
+        emit(*packed)
+    return chunks
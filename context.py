@@ -0,0 +1,112 @@
+import functools
+import logging
+import os
+import re
+from bm25 import tokenize
+
+TOKENIZER_MODEL = "mistralai/Mistral-7B-Instruct-v0.2"
+CONTEXT_TOKEN_BUDGET = 1500  # tokens of retrieved text allowed into the prompt
+CHARS_PER_TOKEN = 4  # estimate used when the tokenizer can't be loaded
+MIN_OVERLAP_CHARS = 20  # shorter shared prefixes/suffixes are left alone
+EXTRACT_SENTENCES = False  # keep only the sentences that share terms with the question
+MIN_SENTENCES_PER_CHUNK = 1
+
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?।])\s+")
+
+@functools.lru_cache(maxsize=1)
+def load_tokenizer():
+    """Load the LLM's tokenizer, or None if it isn't available"""
+    try:
+        from transformers import AutoTokenizer
+        return AutoTokenizer.from_pretrained(TOKENIZER_MODEL, token=os.getenv("HUGGINGFACEHUB_ACESS_TOKEN"))
+    except Exception as e:
+        logging.warning(f"Could not load the {TOKENIZER_MODEL} tokenizer, estimating token counts: {str(e)}")
+        return None
+
+def count_tokens(text):
+    """Count tokens the way the LLM will"""
+    tokenizer = load_tokenizer()
+    if tokenizer is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+def truncate_to_tokens(text, budget):
+    """Cut text to at most budget tokens, preferring to end on a sentence"""
+    if budget <= 0:
+        return ""
+    tokenizer = load_tokenizer()
+    if tokenizer is None:
+        cut = text[:budget * CHARS_PER_TOKEN]
+    else:
+        ids = tokenizer.encode(text, add_special_tokens=False)
+        if len(ids) <= budget:
+            return text
+        cut = tokenizer.decode(ids[:budget])
+    if len(cut) >= len(text):
+        return text
+    sentences = _SENTENCE_BOUNDARY.split(cut)
+    return " ".join(sentences[:-1]) if len(sentences) > 1 else cut.rstrip()
+
+def _overlap(left, right):
+    """Length of the longest suffix of left that is a prefix of right"""
+    for size in range(min(len(left), len(right)), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+def remove_overlaps(texts):
+    """Drop text repeated between chunks by the splitter's overlap.
+
+    A chunk contained in an earlier one is dropped, and a chunk that starts
+    with the end of an earlier one, or ends with the start of one, loses the
+    shared part.
+    """
+    kept = []
+    for text in texts:
+        text = text.strip()
+        if not text or any(text in other for other in kept):
+            continue
+        for other in kept:
+            text = text[_overlap(other, text):]
+            size = _overlap(text, other)
+            if size:
+                text = text[:-size]
+        text = text.strip()
+        if text:
+            kept.append(text)
+    return kept
+
+def relevant_sentences(text, question):
+    """Keep the sentences of a chunk that share terms with the question, in order"""
+    terms = set(tokenize(question))
+    if not terms:
+        return text
+    sentences = _SENTENCE_BOUNDARY.split(text)
+    scores = [len(terms & set(tokenize(sentence))) for sentence in sentences]
+    if sum(1 for score in scores if score) < MIN_SENTENCES_PER_CHUNK:
+        best = sorted(range(len(sentences)), key=lambda i: scores[i], reverse=True)[:MIN_SENTENCES_PER_CHUNK]
+        return " ".join(sentences[i] for i in sorted(best))
+    return " ".join(sentence for sentence, score in zip(sentences, scores) if score)
+
+def pack_context(texts, question=None, budget=CONTEXT_TOKEN_BUDGET, extract_sentences=EXTRACT_SENTENCES):
+    """Build the prompt context from ranked chunk texts within a token budget.
+
+    Overlap between chunks is removed, chunks are optionally cut down to
+    their query-relevant sentences, and chunks are added best first until
+    the budget runs out; the one that crosses it is truncated.
+    """
+    parts, used = [], 0
+    separator = count_tokens("\n\n")
+    for text in remove_overlaps(texts):
+        if extract_sentences and question:
+            text = relevant_sentences(text, question)
+        tokens = count_tokens(text)
+        remaining = budget - used - (separator if parts else 0)
+        if tokens > remaining:
+            text = truncate_to_tokens(text, remaining)
+            if text:
+                parts.append(text)
+            break
+        parts.append(text)
+        used += tokens + (separator if len(parts) > 1 else 0)
+    return "\n\n".join(parts)
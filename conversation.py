@@ -0,0 +1,97 @@
+import logging
+import re
+from bm25 import tokenize
+from context import count_tokens, truncate_to_tokens
+from lookup import FILLER_WORDS, INTENTS, find_names
+
+HISTORY_TURNS = 10  # most recent turns considered; older ones are forgotten
+RECENT_TURNS = 3  # turns quoted in the prompt, the rest of the window is summarized
+ANSWER_TOKENS = 150  # of each quoted answer
+SUMMARY_TOKENS = 120
+CONDENSE_WITH_LLM = False  # let the LLM rewrite follow-ups instead of the keyword heuristic
+FOLLOW_UP_WORDS = frozenset("""
+it its this that these those they them their he she his her also more else same other another again
+""".split())
+# Words that say what is asked, or for whom, rather than what it is about; a
+# question made only of these names no herb, formulation or condition of its own
+QUESTION_WORDS = frozenset(word for words, _ in INTENTS.values() for word in words) | FILLER_WORDS | frozenset("""
+take taking taken work works effect effective better best long often time times way ways
+child children kids adults elderly pregnancy pregnant women men
+""".split())
+
+CONDENSE_TEMPLATE = """Rewrite the follow-up question as a stand-alone question, using the conversation for context.
+Return only the rewritten question.
+Conversation:
+{chat_history}
+Follow-up question: {question}
+Stand-alone question:"""
+
+def is_follow_up(question, names=None):
+    """Guess whether a question depends on the previous turns.
+
+    It does if it has no subject of its own ("what about the dose?"), or if
+    it refers back ("can I give it to children?") without naming a herb in
+    names, the lookup index's name table. "Dose of Triphala" and "What is
+    Triphala and how do I take it?" stand on their own. Without names, any
+    term outside QUESTION_WORDS counts as a subject.
+    """
+    if all(term in QUESTION_WORDS for term in tokenize(question)):
+        return True
+    if names is None or not set(re.findall(r"\w+", question.lower())) & FOLLOW_UP_WORDS:
+        return False
+    return not find_names(question, names)[0]
+
+def condense_question(question, history, llm=None, names=None):
+    """Rewrite a follow-up into a stand-alone question for retrieval.
+
+    Questions that don't look like follow-ups are returned unchanged. A
+    follow-up is otherwise prefixed with the earlier questions it builds on,
+    back to the last one that stood on its own; with CONDENSE_WITH_LLM the
+    LLM rewrites it instead, falling back to the heuristic on failure.
+    names is passed on to is_follow_up.
+    """
+    history = history[-HISTORY_TURNS:] if history else []
+    if not history or not is_follow_up(question, names):
+        return question
+    if llm is not None and CONDENSE_WITH_LLM:
+        try:
+            prompt = CONDENSE_TEMPLATE.format(chat_history=format_history(history), question=question)
+            rewritten = llm.invoke(prompt).strip().splitlines()
+            if rewritten and rewritten[0].strip():
+                return rewritten[0].strip()
+        except Exception as e:
+            logging.error(f"Error condensing follow-up question: {str(e)}")
+    context = []
+    for turn in reversed(history[-RECENT_TURNS:]):
+        context.insert(0, turn["question"].strip())
+        if not is_follow_up(turn["question"], names):
+            break
+    return " ".join(context + [question.strip()])
+
+def summarize_turns(turns, budget=SUMMARY_TOKENS):
+    """Summarize older turns as the questions asked, most recent kept when over budget"""
+    questions, used = [], count_tokens("Earlier the user asked about: ")
+    for turn in reversed(turns):
+        question = turn["question"].strip()
+        tokens = count_tokens(question) + 1
+        if used + tokens > budget:
+            break
+        questions.insert(0, question)
+        used += tokens
+    return f"Earlier the user asked about: {'; '.join(questions)}" if questions else ""
+
+def format_history(history):
+    """Render the memory window for the prompt.
+
+    Only the last HISTORY_TURNS turns count; the most recent RECENT_TURNS are
+    quoted with trimmed answers and the rest collapse into a one-line summary,
+    so the prompt stays the same size however long the conversation gets.
+    """
+    history = history[-HISTORY_TURNS:] if history else []
+    older, recent = history[:-RECENT_TURNS], history[-RECENT_TURNS:]
+    lines = [summarize_turns(older)] if older else []
+    for turn in recent:
+        lines.append(f"User: {turn['question'].strip()}")
+        if turn.get("answer"):
+            lines.append(f"Vedabot: {truncate_to_tokens(turn['answer'].strip(), ANSWER_TOKENS)}")
+    return "\n".join(line for line in lines if line)
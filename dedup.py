@@ -0,0 +1,88 @@
+import re
+import zlib
+from collections import defaultdict
+import numpy as np
+
+SHINGLE_SIZE = 5  # words per shingle
+NUM_PERM = 64
+NUM_BANDS = 16
+_PRIME = (1 << 31) - 1
+
+# Fixed seed so signatures stay comparable across ingest runs
+_rng = np.random.RandomState(1102)
+_PERM_A = _rng.randint(1, _PRIME, size=NUM_PERM).astype(np.uint64)
+_PERM_B = _rng.randint(0, _PRIME, size=NUM_PERM).astype(np.uint64)
+
+def shingles(text):
+    """Return the set of hashed word shingles of a text"""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= SHINGLE_SIZE:
+        return {zlib.crc32(" ".join(words).encode()) & _PRIME}
+    return {
+        zlib.crc32(" ".join(words[i:i + SHINGLE_SIZE]).encode()) & _PRIME
+        for i in range(len(words) - SHINGLE_SIZE + 1)
+    }
+
+def minhash(text):
+    """Compute the MinHash signature of a text"""
+    values = np.fromiter(shingles(text), dtype=np.uint64)
+    hashes = (np.outer(values, _PERM_A) + _PERM_B) % _PRIME
+    return hashes.min(axis=0).astype(np.uint32)
+
+class NearDuplicateIndex:
+    """MinHash/LSH index of chunk signatures used to spot near-duplicate chunks"""
+
+    def __init__(self, threshold=0.9):
+        self.threshold = threshold
+        self.signatures = {}
+        self._buckets = defaultdict(set)
+
+    def _bands(self, signature):
+        rows = NUM_PERM // NUM_BANDS
+        for band in range(NUM_BANDS):
+            yield band, signature[band * rows:(band + 1) * rows].tobytes()
+
+    def find(self, signature):
+        """Return the id of an indexed chunk similar to the signature, if any"""
+        candidates = set()
+        for key in self._bands(signature):
+            candidates.update(self._buckets.get(key, ()))
+        best_id, best_score = None, self.threshold
+        for chunk_id in candidates:
+            score = float(np.mean(self.signatures[chunk_id] == signature))
+            if score >= best_score:
+                best_id, best_score = chunk_id, score
+        return best_id
+
+    def add(self, chunk_id, signature):
+        """Index a chunk signature"""
+        self.signatures[chunk_id] = signature
+        for key in self._bands(signature):
+            self._buckets[key].add(chunk_id)
+
+    def remove(self, chunk_ids):
+        """Drop chunks from the index"""
+        for chunk_id in chunk_ids:
+            signature = self.signatures.pop(chunk_id, None)
+            if signature is None:
+                continue
+            for key in self._bands(signature):
+                self._buckets[key].discard(chunk_id)
+                if not self._buckets[key]:
+                    del self._buckets[key]
+
+    def save(self, path):
+        """Persist the signatures to an .npz file"""
+        ids = list(self.signatures)
+        matrix = np.array([self.signatures[i] for i in ids], dtype=np.uint32).reshape(len(ids), NUM_PERM)
+        with open(path, "wb") as file:
+            np.savez(file, ids=np.array(ids, dtype=str), signatures=matrix)
+
+    @classmethod
+    def load(cls, path, threshold=0.9):
+        """Load signatures saved with save()"""
+        index = cls(threshold)
+        with np.load(path) as data:
+            for chunk_id, signature in zip(data["ids"], data["signatures"]):
+                index.add(str(chunk_id), signature)
+        return index
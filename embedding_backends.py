@@ -0,0 +1,101 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# torch is the reference; the ONNX backends run the exports shipped with the
+# model on ONNX Runtime and need sentence-transformers[onnx]
+BACKENDS = {
+    "torch": {},
+    "onnx": {"backend": "onnx"},
+    "onnx-int8": {"backend": "onnx", "model_kwargs": {"file_name": "onnx/model_qint8_avx2.onnx"}},
+}
+EMBEDDING_BACKEND = os.getenv("VEDABOT_EMBEDDING_BACKEND", "torch")
+MAX_BATCH_SIZE = 256
+BATCH_CHAR_BUDGET = 64000  # padded characters per forward pass when embedding documents
+QUERY_CACHE_SIZE = 2048
+COSINE_TOLERANCE = 0.99  # lowest cosine similarity to the index's vectors that keeps the index usable
+
+class BatchedEmbeddings(Embeddings):
+    """Wraps an embedding model with length-bucketed batching and a query cache.
+
+    Documents are sorted by length and grouped so each forward pass pads to
+    roughly BATCH_CHAR_BUDGET characters: short chunks go through in large
+    batches and long ones in small batches. Query vectors are kept in an LRU
+    cache so repeated questions skip the model.
+    """
+
+    def __init__(self, model, cache_size=QUERY_CACHE_SIZE):
+        self.model = model
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def embed_documents(self, texts):
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = [None] * len(texts)
+        start = 0
+        while start < len(order):
+            end = start + 1
+            while (end < len(order) and end - start < MAX_BATCH_SIZE
+                   and (end - start + 1) * len(texts[order[end]]) <= BATCH_CHAR_BUDGET):
+                end += 1
+            batch = order[start:end]
+            for i, vector in zip(batch, self.model.embed_documents([texts[i] for i in batch])):
+                vectors[i] = vector
+            start = end
+        return vectors
+
+    def embed_query(self, text):
+        with self._lock:
+            vector = self._cache.get(text)
+            if vector is not None:
+                self._cache.move_to_end(text)
+                self.stats["hits"] += 1
+                return vector
+            self.stats["misses"] += 1
+        vector = self.model.embed_query(text)
+        if self.cache_size:
+            with self._lock:
+                self._cache[text] = vector
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return vector
+
+def load_embeddings(backend=None, cache_size=QUERY_CACHE_SIZE):
+    """Load the sentence embedding model on the given backend (default EMBEDDING_BACKEND)"""
+    backend = backend or EMBEDDING_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+    model = HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL,
+        model_kwargs={"device": "cpu", **BACKENDS[backend]},
+        encode_kwargs={"batch_size": MAX_BATCH_SIZE},
+    )
+    return BatchedEmbeddings(model, cache_size=cache_size)
+
+def validate_backend(backend, texts, tolerance=COSINE_TOLERANCE, reference_backend="torch"):
+    """Check that a backend's vectors match the reference backend's closely enough to share an index"""
+    reference = np.asarray(load_embeddings(reference_backend, cache_size=0).embed_documents(texts), dtype=np.float32)
+    candidate = np.asarray(load_embeddings(backend, cache_size=0).embed_documents(texts), dtype=np.float32)
+    cosine = (reference * candidate).sum(axis=1) / (
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1) + 1e-12
+    )
+    report = {
+        "backend": backend,
+        "reference": reference_backend,
+        "texts": len(texts),
+        "min_cosine": float(cosine.min()) if len(texts) else None,
+        "mean_cosine": float(cosine.mean()) if len(texts) else None,
+        "tolerance": tolerance,
+    }
+    report["ok"] = not len(texts) or report["min_cosine"] >= tolerance
+    if not report["ok"]:
+        logging.warning(f"Embedding backend {backend} drifts from {reference_backend}: "
+                        f"min cosine {report['min_cosine']:.4f}")
+    return report
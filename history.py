@@ -0,0 +1,101 @@
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+HISTORY_DB_PATH = "chat_history.sqlite"
+HISTORY_PAGE_SIZE = 20
+HISTORY_RETENTION_DAYS = 90
+MAX_TURNS_PER_SESSION = 500
+COMPACT_INTERVAL = 3600  # seconds between retention sweeps
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+class ChatHistory:
+    """Append-only per-session chat history in SQLite.
+
+    The database runs in WAL mode so Streamlit sessions on different threads
+    or processes can append while others read, and each write touches one
+    row instead of rewriting the whole history. Turns older than the
+    retention period, and beyond MAX_TURNS_PER_SESSION in a session, are
+    deleted by a periodic compaction.
+    """
+
+    def __init__(self, path=HISTORY_DB_PATH, retention_days=HISTORY_RETENTION_DAYS,
+                 max_turns=MAX_TURNS_PER_SESSION):
+        self.path = path
+        self.retention_days = retention_days
+        self.max_turns = max_turns
+        self._local = threading.local()
+        self._compacted_at = 0.0
+        with self.connection as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS turns (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "session_id TEXT NOT NULL, created_at REAL NOT NULL, question TEXT NOT NULL, answer TEXT)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS turns_session ON turns (session_id, id)")
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def append(self, session_id, question, answer=None):
+        """Record one question (and its answer) for a session"""
+        with self.connection as connection:
+            cursor = connection.execute(
+                "INSERT INTO turns (session_id, created_at, question, answer) VALUES (?, ?, ?, ?)",
+                (session_id, time.time(), question, answer),
+            )
+        if time.time() - self._compacted_at > COMPACT_INTERVAL:
+            self.compact()
+        return cursor.lastrowid
+
+    def page(self, session_id, limit=HISTORY_PAGE_SIZE, before_id=None):
+        """Return up to limit turns of a session, newest first, older than before_id if given"""
+        rows = self.connection.execute(
+            "SELECT id, created_at, question, answer FROM turns WHERE session_id = ? AND id < ? "
+            "ORDER BY id DESC LIMIT ?",
+            (session_id, before_id if before_id is not None else 2 ** 63 - 1, limit),
+        ).fetchall()
+        return [
+            {"id": id, "time": datetime.fromtimestamp(created_at).strftime(TIME_FORMAT),
+             "question": question, "answer": answer}
+            for id, created_at, question, answer in rows
+        ]
+
+    def clear(self, session_id):
+        """Delete a session's history"""
+        with self.connection as connection:
+            connection.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+
+    def compact(self):
+        """Apply the retention limits and checkpoint the WAL"""
+        self._compacted_at = time.time()
+        cutoff = time.time() - self.retention_days * 86400
+        with self.connection as connection:
+            expired = connection.execute("DELETE FROM turns WHERE created_at < ?", (cutoff,)).rowcount
+            trimmed = connection.execute(
+                "DELETE FROM turns WHERE id IN (SELECT id FROM (SELECT id, ROW_NUMBER() OVER "
+                "(PARTITION BY session_id ORDER BY id DESC) AS n FROM turns) WHERE n > ?)",
+                (self.max_turns,),
+            ).rowcount
+        self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        if expired or trimmed:
+            logging.info(f"Compacted chat history: {expired} expired and {trimmed} excess turns removed")
+
+_chat_history = None
+_chat_history_lock = threading.Lock()
+
+def get_chat_history():
+    """Return the process-wide chat history store, creating it on first use"""
+    global _chat_history
+    with _chat_history_lock:
+        if _chat_history is None:
+            _chat_history = ChatHistory()
+        return _chat_history
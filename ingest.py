@@ -1,32 +1,558 @@
-from langchain_community.embeddings import HuggingFaceEmbeddings
+import argparse
+import fnmatch
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import re
+import shutil
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import faiss
+import numpy as np
+from tqdm import tqdm
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
-from langchain_community.document_loaders import PyPDFLoader, DirectoryLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter 
+from langchain_community.document_loaders import PyPDFLoader
+from chunking import CHUNKER_VERSION, chunk_pages, monograph_sections, volume_name
+from dedup import NearDuplicateIndex, minhash
+from embedding_backends import BACKENDS, EMBEDDING_BACKEND, validate_backend
+from embedding_backends import load_embeddings as load_embedding_backend
+from lookup import LOOKUP_FILE, LookupWriter
+import metrics
+from store import (CHUNKS_FILE, INDEX_FILE, LEGACY_DOCSTORE_FILE, SHARDS_DIR, list_shards, load_store,
+                   load_store_for_update, save_store)
 
 DATA_PATH = 'data/'
+DB_FAISS_PATH = 'vectorstore/db_faiss'
+MANIFEST_PATH = os.path.join(DB_FAISS_PATH, 'manifest.json')
+SHARDS_PATH = os.path.join(DB_FAISS_PATH, SHARDS_DIR)
+SIGNATURES_FILE = 'signatures.npz'  # near-duplicate signatures, kept per shard
+DEDUP_REPORT_PATH = os.path.join(DB_FAISS_PATH, 'dedup_report.json')
+# PDFs matching a pattern share a shard; any other PDF gets a shard of its own
+SHARD_GROUPS = {
+    "pharmacopoeia": "API-Vol-*.pdf",
+    "charaka_samhita": "Charaka_Samhita*.pdf",
+    "cooking": "Ayurvedic_Cooking*.pdf",
+}
+NEAR_DUPLICATE_THRESHOLD = 0.9  # estimated Jaccard similarity of word shingles
+PARSE_WORKERS = os.cpu_count() or 1
+EMBED_BATCH_SIZE = 256  # chunks embedded and added to the index at a time
 
-def create_vector_db():
-    
-    loader = DirectoryLoader(DATA_PATH, glob='*.pdf', loader_cls=PyPDFLoader)
-    
-    documents = loader.load()
+# Index types selectable at ingest time; query-time knobs live in model.py
+INDEX_TYPES = ("flat", "ivf", "hnsw", "pq", "sq")
+IVF_NLIST = 256  # inverted lists for "ivf" and "pq"
+HNSW_M = 32  # graph neighbours per node for "hnsw"
+PQ_M = 48  # sub-quantizers for "pq", reduced to a divisor of the embedding dimension
+TRAINED_INDEX_TYPES = ("ivf", "pq", "sq")
+TRAIN_SIZE = 39 * IVF_NLIST  # vectors buffered to train TRAINED_INDEX_TYPES
+# faiss can remove vectors from these in place; the others are rebuilt instead
+REMOVABLE_INDEX_TYPES = ("flat", "sq")
 
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=500,chunk_overlap=50)
-    
-    texts = text_splitter.split_documents(documents)
+def file_hash(path):
+    """Return the SHA-256 hex digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
 
-    embeddings = HuggingFaceEmbeddings(
-            model_name='sentence-transformers/all-MiniLM-L6-v2', 
-            model_kwargs={
-                'device': 'cpu'
-                }
-            )
+def load_manifest():
+    """Load the ingest manifest recording which files are in the index"""
+    if os.path.exists(MANIFEST_PATH):
+        with open(MANIFEST_PATH, "r") as file:
+            return json.load(file)
+    return {"files": {}}
 
-    DB_FAISS_PATH = 'vectorstore/db_faiss'
+def save_manifest(manifest):
+    """Write the manifest next to the index, replacing it atomically"""
+    tmp_path = MANIFEST_PATH + ".tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(tmp_path, MANIFEST_PATH)
 
-    db = FAISS.from_documents(texts, embeddings)
-    
-    db.save_local(DB_FAISS_PATH)
+def shard_name(name):
+    """Return the shard a PDF in DATA_PATH is indexed into"""
+    for shard, pattern in SHARD_GROUPS.items():
+        if fnmatch.fnmatch(name, pattern):
+            return shard
+    return re.sub(r"[^a-z0-9]+", "_", os.path.splitext(name)[0].lower()).strip("_")
+
+def shard_path(shard):
+    return os.path.join(SHARDS_PATH, shard)
+
+def load_embeddings():
+    """Load the sentence embedding model used for the index"""
+    return load_embedding_backend(cache_size=0)
+
+def parse_pdf(path):
+    """Load the pages of one PDF (runs in a worker process)"""
+    return PyPDFLoader(path).load()
+
+def parse_pdfs(names):
+    """Parse PDFs in a process pool, yielding (name, pages) in input order.
+
+    At most two files per worker are in flight, so memory stays bounded by
+    the pool size rather than the corpus size.
+    """
+    with ProcessPoolExecutor(max_workers=PARSE_WORKERS) as executor:
+        pending = deque()
+        names = iter(names)
+        for name in names:
+            pending.append((name, executor.submit(parse_pdf, os.path.join(DATA_PATH, name))))
+            if len(pending) >= 2 * PARSE_WORKERS:
+                break
+        while pending:
+            name, future = pending.popleft()
+            for next_name in names:
+                pending.append((next_name, executor.submit(parse_pdf, os.path.join(DATA_PATH, next_name))))
+                break
+            yield name, future.result()
+
+def index_spec(index_type, n, dimension):
+    """Return the faiss index_factory string for an index trained on n vectors"""
+    if index_type in TRAINED_INDEX_TYPES and n < 39:
+        logging.warning(f"Only {n} vectors to train a {index_type} index, using a flat index")
+        return "Flat"
+    nlist = max(1, min(IVF_NLIST, n // 39))
+    if index_type == "ivf":
+        return f"IVF{nlist},Flat"
+    if index_type == "hnsw":
+        return f"HNSW{HNSW_M}"
+    if index_type == "pq":
+        # faiss wants 39 training points per centroid: 256 for 8-bit codes, 16 for 4-bit ones
+        if n < 39 * 16:
+            logging.info(f"Only {n} vectors to train a pq index, using SQ8 until the shard grows")
+            return "SQ8"
+        return f"IVF{nlist},PQ{math.gcd(PQ_M, dimension)}x{8 if n >= 39 * 256 else 4}"
+    if index_type == "sq":
+        return "SQ8"
+    return "Flat"
+
+def outgrown(spec, index_type, n, dimension):
+    """Whether an index trained as spec has grown enough to be retrained for its n vectors.
+
+    That is when it was trained as a flat fallback, when it would now get at
+    least twice as many inverted lists, or when PQ codes could now be wider.
+    """
+    if index_type not in TRAINED_INDEX_TYPES or n < 39:
+        return False
+    wanted = index_spec(index_type, n, dimension)
+    if wanted == spec:
+        return False
+    nlist = [int(match.group(1)) if match else 0 for match in (re.match(r"IVF(\d+)", s) for s in (spec, wanted))]
+    bits = [int(match.group(1)) if match else 0 for match in (re.search(r"x(\d+)$", s) for s in (spec, wanted))]
+    return (spec == "Flat" or (spec == "SQ8" and index_type == "pq")
+            or nlist[1] >= max(1, 2 * nlist[0]) or bits[1] > bits[0])
+
+class IndexBuilder:
+    """Embeds chunk batches and appends them to a FAISS store.
+
+    Flat and HNSW indexes get each batch as soon as it is embedded. The
+    TRAINED_INDEX_TYPES buffer their first TRAIN_SIZE vectors, train on them
+    and then add everything; a corpus smaller than that is trained on
+    whatever was buffered when finish() is called.
+    """
+
+    def __init__(self, embeddings, index_type, db=None):
+        self.embeddings = embeddings
+        self.index_type = index_type
+        self.db = db
+        self.spec = None
+        self._pending = []
+
+    def add(self, batch):
+        """Embed a batch of chunks and add it to the index"""
+        texts = [text.page_content for text in batch]
+        with metrics.span("ingest.embed"):
+            vectors = self.embeddings.embed_documents(texts)
+        self._pending.append((texts, vectors, [text.metadata for text in batch],
+                              [text.metadata["chunk_id"] for text in batch]))
+        if (self.db is not None or self.index_type not in TRAINED_INDEX_TYPES
+                or sum(len(item[0]) for item in self._pending) >= TRAIN_SIZE):
+            self._flush()
+
+    def finish(self):
+        """Add any buffered vectors and return the store"""
+        if self._pending:
+            self._flush()
+        return self.db
+
+    def rebuild(self, db):
+        """Train a new index for every chunk of db, re-embedding their texts, and return it"""
+        documents = [db.docstore.search(db.index_to_docstore_id[i]) for i in range(len(db.index_to_docstore_id))]
+        self.db, self.spec = None, None
+        for start in range(0, len(documents), EMBED_BATCH_SIZE):
+            self.add(documents[start:start + EMBED_BATCH_SIZE])
+        return self.finish()
+
+    def _flush(self):
+        if self.db is None:
+            train = np.array([vector for item in self._pending for vector in item[1]], dtype=np.float32)
+            self.spec = index_spec(self.index_type, *train.shape)
+            index = faiss.index_factory(train.shape[1], self.spec)
+            if not index.is_trained:
+                with metrics.span("ingest.train"):
+                    index.train(train)
+            self.db = FAISS(self.embeddings, index, InMemoryDocstore(), {})
+        with metrics.span("ingest.index_add"):
+            for texts, vectors, metadatas, ids in self._pending:
+                self.db.add_embeddings(zip(texts, vectors), metadatas=metadatas, ids=ids)
+        self._pending = []
+
+def recall_report(sample_size=200, k=10):
+    """Compare each saved shard against exact search over the same chunks.
+
+    The chunk texts are re-embedded to get exact vectors, a sample of them
+    is used as queries, and recall@k and mean latency are reported for the
+    shard's index at several nprobe/efSearch settings.
+    """
+    embeddings = load_embeddings()
+    shards = load_manifest().get("shards", {})
+    return {
+        shard: _shard_recall_report(load_store(folder, embeddings), embeddings,
+                                    shards.get(shard, {}).get("index", "Flat"), sample_size, k)
+        for shard, folder in list_shards(DB_FAISS_PATH).items()
+    }
+
+def _shard_recall_report(db, embeddings, spec, sample_size, k):
+    ids = [db.index_to_docstore_id[i] for i in range(len(db.index_to_docstore_id))]
+    texts = [db.docstore.search(chunk_id).page_content for chunk_id in ids]
+    vectors = np.empty((len(texts), db.index.d), dtype=np.float32)
+    for start in range(0, len(texts), EMBED_BATCH_SIZE):
+        vectors[start:start + EMBED_BATCH_SIZE] = embeddings.embed_documents(texts[start:start + EMBED_BATCH_SIZE])
+
+    exact = faiss.IndexFlatL2(db.index.d)
+    exact.add(vectors)
+    queries = vectors[random.Random(0).sample(range(len(vectors)), min(sample_size, len(vectors)))]
+
+    def run(index):
+        start = time.perf_counter()
+        results = np.vstack([index.search(query[None, :], k)[1] for query in queries])
+        return results, (time.perf_counter() - start) * 1000 / len(queries)
+
+    truth, exact_ms = run(exact)
+    report = {
+        "index": spec,
+        "vectors": len(vectors),
+        "k": k,
+        "exact_ms": exact_ms,
+        "settings": [],
+    }
+    params = faiss.ParameterSpace()
+    for name, values in (("nprobe", (1, 4, 16, 64)), ("efSearch", (16, 32, 64, 128))):
+        for value in values:
+            try:
+                params.set_index_parameter(db.index, name, value)
+            except RuntimeError:
+                break
+            found, approx_ms = run(db.index)
+            recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(found, truth)])
+            report["settings"].append({name: value, "recall": float(recall), "ms": approx_ms})
+    if not report["settings"]:
+        found, approx_ms = run(db.index)
+        recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(found, truth)])
+        report["settings"].append({"recall": float(recall), "ms": approx_ms})
+    return report
+
+def sample_chunk_texts(sample_size=200):
+    """Return a sample of the indexed chunk texts across all shards"""
+    texts = []
+    for folder in list_shards(DB_FAISS_PATH).values():
+        path = os.path.join(folder, CHUNKS_FILE)
+        if not os.path.exists(path):
+            continue
+        with sqlite3.connect(path) as connection:
+            texts += [text for (text,) in connection.execute(
+                "SELECT text FROM chunks ORDER BY random() LIMIT ?", (sample_size,)
+            )]
+    return random.sample(texts, min(sample_size, len(texts)))
+
+def _dependents(indexed, removed):
+    """Return indexed files whose duplicates were collapsed onto removed files"""
+    pending, dependents = set(removed), set()
+    while pending:
+        found = {
+            name for name, entry in indexed.items()
+            if name not in dependents and name not in removed
+            and (entry.get("duplicate_of") in pending or pending & set(entry.get("depends_on", [])))
+        }
+        dependents |= found
+        pending = found
+    return dependents
+
+def create_vector_db(incremental=True, index_type=None):
+    """Build or update the sharded FAISS store from the PDFs in DATA_PATH.
+
+    Every PDF belongs to one shard (see shard_name), and each shard is a
+    self-contained store under SHARDS_PATH with its own index, chunk table,
+    BM25 postings and near-duplicate signatures. Only the shards whose PDFs
+    changed are loaded and rewritten, so adding a corpus adds a shard
+    without touching the others.
+
+    In incremental mode only PDFs whose content hash is new or changed since
+    the last run are embedded, and vectors of removed or changed PDFs are
+    deleted from their shard. Pass incremental=False for a full rebuild.
+
+    PDFs are parsed in a process pool while the main process chunks them
+    along their monograph sections (see chunking.py) and embeds chunks in
+    batches of EMBED_BATCH_SIZE, appending each batch to its shard's index as
+    it is ready.
+
+    index_type picks the FAISS index (one of INDEX_TYPES) for every shard; by
+    default the existing type is kept and a new store is flat. Changing the
+    type rebuilds everything, and removing files from a shard whose index
+    faiss can't delete from rebuilds that shard. A trained shard that has
+    outgrown the index it was first trained for (see outgrown) is retrained.
+
+    The monograph sections (dose, uses, properties…) of every PDF are also
+    written to the lookup index that answers direct herb questions without
+    the LLM (see lookup.py).
+
+    Byte-identical PDFs are indexed once, and chunks that are near-duplicates
+    of an already indexed chunk of the same shard are skipped; what was
+    collapsed is written to DEDUP_REPORT_PATH. Files that had content
+    collapsed onto a removed file are re-ingested so their text doesn't
+    disappear with it.
+
+    Returns the number of files, pages and chunks processed, the shards
+    written and the time spent, or None if nothing was written.
+    """
+    embeddings = load_embeddings()
+
+    manifest = {"files": {}, "shards": {}}
+    if incremental and os.path.exists(os.path.join(DB_FAISS_PATH, INDEX_FILE)):
+        logging.info("Splitting the single index into per-source shards, rebuilding")
+        return create_vector_db(incremental=False, index_type=index_type or load_manifest().get("index_type"))
+    if incremental and os.path.exists(MANIFEST_PATH):
+        manifest = load_manifest()
+        previous_type = manifest.get("index_type", "flat")
+        if index_type not in (None, previous_type):
+            logging.info(f"Switching index type from {previous_type} to {index_type}, rebuilding")
+            return create_vector_db(incremental=False, index_type=index_type)
+        index_type = previous_type
+        if manifest.get("chunker_version", 1) != CHUNKER_VERSION:
+            logging.info("Chunking has changed since the index was built, rebuilding")
+            return create_vector_db(incremental=False, index_type=index_type)
+        if not os.path.exists(os.path.join(DB_FAISS_PATH, LOOKUP_FILE)):
+            logging.info("The store has no lookup index yet, rebuilding")
+            return create_vector_db(incremental=False, index_type=index_type)
+        previous_backend = manifest.get("embedding_backend", "torch")
+        if previous_backend != EMBEDDING_BACKEND:
+            # Compare with the backend the index vectors came from, not with torch
+            report = validate_backend(EMBEDDING_BACKEND, sample_chunk_texts(), reference_backend=previous_backend)
+            if not report["ok"]:
+                logging.info(f"Embeddings from {EMBEDDING_BACKEND} don't match the {previous_backend} index, rebuilding")
+                return create_vector_db(incremental=False, index_type=index_type)
+    index_type = index_type or "flat"
+    on_disk = list_shards(DB_FAISS_PATH)
+
+    current = {
+        name: file_hash(os.path.join(DATA_PATH, name))
+        for name in sorted(os.listdir(DATA_PATH)) if name.endswith(".pdf")
+    }
+    indexed = manifest["files"]
+    # Files of a shard that went missing, or that now map to another shard, are re-ingested too
+    removed = [
+        name for name, entry in indexed.items()
+        if current.get(name) != entry["hash"] or entry["shard"] not in on_disk or entry["shard"] != shard_name(name)
+    ]
+    rebuilt = set()
+    while True:
+        removed += sorted(_dependents(indexed, removed) & set(current))
+        if index_type in REMOVABLE_INDEX_TYPES:
+            break
+        # faiss can't delete from this index type, so a shard losing vectors is rebuilt from all its files
+        rebuilt = {indexed[name]["shard"] for name in removed if indexed[name]["chunk_ids"]}
+        grow = sorted(name for name, entry in indexed.items() if entry["shard"] in rebuilt and name not in removed)
+        if not grow:
+            break
+        removed += grow
+    added = [name for name in current if name not in indexed or name in removed]
+
+    if manifest["shards"] and not removed and not added:
+        logging.info("Vector store is up to date")
+        return
+    fresh = not manifest["shards"]
+
+    touched = {indexed[name]["shard"] for name in removed} | {shard_name(name) for name in added}
+    dbs, near_duplicates = {}, {}
+    for shard in sorted(touched):
+        near_duplicates[shard] = NearDuplicateIndex(NEAR_DUPLICATE_THRESHOLD)
+        if shard in rebuilt:
+            logging.info(f"Cannot remove vectors from a {index_type} index in place, rebuilding the {shard} shard")
+        elif shard in manifest["shards"] and shard in on_disk:
+            dbs[shard] = load_store_for_update(on_disk[shard], embeddings)
+            signatures_path = os.path.join(on_disk[shard], SIGNATURES_FILE)
+            if os.path.exists(signatures_path):
+                near_duplicates[shard] = NearDuplicateIndex.load(signatures_path, NEAR_DUPLICATE_THRESHOLD)
+    for name in removed:
+        entry = indexed.pop(name)
+        if entry["shard"] in dbs and entry["chunk_ids"]:
+            dbs[entry["shard"]].delete(entry["chunk_ids"])
+        near_duplicates[entry["shard"]].remove(entry["chunk_ids"])
+        logging.info(f"Removed {name} from the {entry['shard']} shard")
+
+    to_parse = []
+    # Files of the same shard are parsed one after another so each shard's batches stay together
+    for name in sorted(added, key=shard_name):
+        digest, shard = current[name], shard_name(name)
+        canonical = next((other for other, entry in indexed.items()
+                          if entry["hash"] == digest and entry["shard"] == shard and "duplicate_of" not in entry), None)
+        if canonical is not None:
+            indexed[name] = {"hash": digest, "shard": shard, "chunk_ids": [], "duplicate_of": canonical}
+            logging.info(f"Skipped {name}: identical to {canonical}")
+        else:
+            # Claim the hash now so later identical files collapse onto this one
+            indexed[name] = {"hash": digest, "shard": shard, "chunk_ids": []}
+            to_parse.append(name)
+
+    owners = {chunk_id: name for name, entry in indexed.items() for chunk_id in entry["chunk_ids"]}
+    lookup = LookupWriter(os.path.join(DB_FAISS_PATH, LOOKUP_FILE), removed, replace=fresh)
+    builders = {}
+    builder = None
+    batch, page_count, chunk_count = [], 0, 0
+    start = time.perf_counter()
+    trace = metrics.start_trace()
+    progress = tqdm(total=len(to_parse), unit="pdf", desc="Ingesting")
+    for name, pages in parse_pdfs(to_parse):
+        digest, shard = current[name], shard_name(name)
+        if shard not in builders:
+            if batch:
+                builder.add(batch)
+                chunk_count += len(batch)
+                batch = []
+            builder = builders[shard] = IndexBuilder(embeddings, index_type, dbs.get(shard))
+        ids, depends_on, collapsed = [], set(), 0
+        with metrics.span("ingest.split"):
+            texts = chunk_pages(pages)
+            source = os.path.join(DATA_PATH, name)
+            rows = [(shard, monograph, section, page, source, volume_name(name), text)
+                    for monograph, section, page, text in monograph_sections(pages)]
+            lookup.add(name, rows)
+        for i, text in enumerate(texts):
+            chunk_id = f"{name}:{digest[:12]}:{i}"
+            with metrics.span("ingest.dedup"):
+                signature = minhash(text.page_content)
+                duplicate_id = near_duplicates[shard].find(signature)
+            if duplicate_id is not None:
+                collapsed += 1
+                depends_on.add(owners.get(duplicate_id, name))
+                continue
+            near_duplicates[shard].add(chunk_id, signature)
+            owners[chunk_id] = name
+            text.metadata["chunk_id"] = chunk_id
+            text.metadata["shard"] = shard
+            batch.append(text)
+            ids.append(chunk_id)
+            if len(batch) >= EMBED_BATCH_SIZE:
+                builder.add(batch)
+                chunk_count += len(batch)
+                batch = []
+        depends_on.discard(name)
+        indexed[name] = {
+            "hash": digest,
+            "shard": shard,
+            "chunk_ids": ids,
+            "depends_on": sorted(depends_on),
+            "collapsed_chunks": collapsed,
+        }
+        page_count += len(pages)
+        metrics.increment("vedabot_ingest_pages_total", len(pages))
+        metrics.increment("vedabot_ingest_chunks_total", len(ids))
+        metrics.increment("vedabot_ingest_collapsed_chunks_total", collapsed)
+        elapsed = time.perf_counter() - start
+        progress.update(1)
+        progress.set_postfix(pages_per_s=f"{page_count / elapsed:.1f}", chunks_per_s=f"{chunk_count / elapsed:.1f}")
+        logging.info(f"Indexed {name} into {shard}: {len(ids)} chunks, {collapsed} near-duplicates skipped")
+    if batch:
+        builder.add(batch)
+        chunk_count += len(batch)
+    progress.close()
+    elapsed = time.perf_counter() - start
+    if to_parse:
+        logging.info(
+            f"Embedded {chunk_count} chunks from {page_count} pages in {elapsed:.1f}s "
+            f"({page_count / elapsed:.1f} pages/s, {chunk_count / elapsed:.1f} chunks/s)"
+        )
+
+    with metrics.span("ingest.save"):
+        for shard in sorted(touched):
+            db = builders[shard].finish() if shard in builders else dbs.get(shard)
+            if db is None or not db.index_to_docstore_id:
+                manifest["shards"].pop(shard, None)
+                continue
+            spec = builders[shard].spec if shard in builders else None
+            if spec is None:
+                spec = manifest["shards"].get(shard, {}).get("index", "Flat")
+                if outgrown(spec, index_type, db.index.ntotal, db.index.d):
+                    # nlist and the PQ width were picked for the vectors the index was first trained on
+                    logging.info(f"The {shard} shard outgrew its {spec} index, retraining it on {db.index.ntotal} vectors")
+                    builder = IndexBuilder(embeddings, index_type)
+                    with metrics.span("ingest.retrain"):
+                        db = builder.rebuild(db)
+                    spec = builder.spec
+            save_store(db, shard_path(shard))
+            near_duplicates[shard].save(os.path.join(shard_path(shard), SIGNATURES_FILE))
+            manifest["shards"][shard] = {
+                "index": spec,
+                "chunks": len(db.index_to_docstore_id),
+            }
+        lookup.finish()
+    if not manifest["shards"]:
+        logging.warning(f"No PDF content found in {DATA_PATH}")
+        return
+
+    manifest["index_type"] = index_type
+    manifest["embedding_backend"] = EMBEDDING_BACKEND
+    manifest["chunker_version"] = CHUNKER_VERSION
+    manifest.pop("index", None)
+    save_manifest(manifest)
+    # Drop emptied shards and the files of a store saved before sharding
+    for shard in set(os.listdir(SHARDS_PATH)) - set(manifest["shards"]):
+        shutil.rmtree(shard_path(shard))
+        logging.info(f"Removed the {shard} shard")
+    for name in (INDEX_FILE, CHUNKS_FILE, LEGACY_DOCSTORE_FILE, SIGNATURES_FILE):
+        if os.path.exists(os.path.join(DB_FAISS_PATH, name)):
+            os.remove(os.path.join(DB_FAISS_PATH, name))
+
+    report = {
+        "duplicate_files": {
+            name: entry["duplicate_of"] for name, entry in indexed.items() if "duplicate_of" in entry
+        },
+        "collapsed_chunks": {
+            name: entry["collapsed_chunks"] for name, entry in indexed.items() if entry.get("collapsed_chunks")
+        },
+    }
+    with open(DEDUP_REPORT_PATH, "w") as file:
+        json.dump(report, file, indent=2)
+    logging.info(
+        f"Collapsed {len(report['duplicate_files'])} duplicate files and "
+        f"{sum(report['collapsed_chunks'].values())} near-duplicate chunks"
+    )
+    logging.info(f"Ingest stage timings: {', '.join(f'{stage}={seconds:.2f}s' for stage, seconds in trace.timings().items())}")
+    return {"files": len(to_parse), "pages": page_count, "chunks": chunk_count, "shards": sorted(touched),
+            "seconds": elapsed}
 
 if __name__ == "__main__":
-    create_vector_db()
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build the sharded FAISS store from the PDFs in data/")
+    parser.add_argument("--full", action="store_true", help="rebuild the whole index instead of updating it")
+    parser.add_argument("--index", choices=INDEX_TYPES, help="FAISS index type (default: keep the current one, or flat)")
+    parser.add_argument("--recall-report", action="store_true",
+                        help="report recall and latency of each saved shard against exact search")
+    parser.add_argument("--validate-embeddings", choices=BACKENDS, metavar="BACKEND",
+                        help="compare a backend's vectors for indexed chunks against the backend the index was built with")
+    args = parser.parse_args()
+    if args.recall_report:
+        print(json.dumps(recall_report(), indent=2))
+    elif args.validate_embeddings:
+        report = validate_backend(args.validate_embeddings, sample_chunk_texts(),
+                                  reference_backend=load_manifest().get("embedding_backend", "torch"))
+        print(json.dumps(report, indent=2))
+    else:
+        create_vector_db(incremental=not args.full, index_type=args.index)
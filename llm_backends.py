@@ -0,0 +1,322 @@
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import requests
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+from pydantic import Field
+import metrics
+
+LLM_MODEL = "mistralai/Mistral-7B-Instruct-v0.2"
+# "hosted" is the Hugging Face endpoint; "llamacpp" runs a GGUF model in
+# process (needs llama-cpp-python) and "http" talks to a llama.cpp server
+BACKENDS = ("hosted", "llamacpp", "http")
+LLM_BACKEND = os.getenv("VEDABOT_LLM_BACKEND", "hosted")
+FALLBACK_BACKEND = os.getenv("VEDABOT_LLM_FALLBACK") or None  # e.g. "http", used when the primary fails or stalls
+LOCAL_MODEL_PATH = os.getenv("VEDABOT_LOCAL_MODEL", "models/mistral-7b-instruct-v0.2.Q4_K_M.gguf")
+LOCAL_LLM_URL = os.getenv("VEDABOT_LOCAL_LLM_URL", "http://localhost:8080")
+MAX_NEW_TOKENS = 1024
+TEMPERATURE = 0.1
+REQUEST_DEADLINE = 60.0  # seconds for a whole answer, and at most between two streamed tokens
+MAX_RETRIES = 2
+RETRY_BASE_DELAY = 0.5  # seconds, doubled on each retry with jitter
+HEDGE_AFTER = 8.0  # seconds without a first token before a second request is sent
+BREAKER_FAILURES = 5  # consecutive failures that open a backend's circuit breaker
+BREAKER_RESET_SECONDS = 60.0  # how long an open breaker waits before letting a trial request through
+
+class CircuitBreaker:
+    """Stops sending requests to a backend after repeated failures.
+
+    After `failures` consecutive errors or late answers the breaker opens
+    and the backend is skipped; once `reset_seconds` have passed a single
+    trial request is let through, and its outcome closes the breaker or
+    opens it again. A trial with no outcome after `trial_timeout` seconds,
+    e.g. a hung in-process model, counts as a failure.
+    """
+
+    def __init__(self, name, failures=BREAKER_FAILURES, reset_seconds=BREAKER_RESET_SECONDS,
+                 trial_timeout=REQUEST_DEADLINE):
+        self.name = name
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self.trial_timeout = trial_timeout
+        self._errors = 0
+        self._opened_at = None
+        self._trial_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self._opened_at >= self.reset_seconds else "open"
+
+    def allow(self):
+        """Whether a request may be sent to the backend now"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            now = time.monotonic()
+            if self._trial_at is not None:
+                if now - self._trial_at < self.trial_timeout:
+                    return False
+                logging.warning(f"Trial request to LLM backend {self.name} never finished, keeping its breaker open")
+                self._trial_at, self._opened_at = None, now
+            if now - self._opened_at < self.reset_seconds:
+                return False
+            self._trial_at = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logging.info(f"LLM backend {self.name} recovered, closing its circuit breaker")
+            self._errors = 0
+            self._opened_at = None
+            self._trial_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._errors += 1
+            if self._trial_at is not None or self._errors >= self.failures:
+                if self._opened_at is None:
+                    logging.warning(f"LLM backend {self.name} failed {self._errors} times, opening its circuit breaker")
+                self._opened_at = time.monotonic()
+            self._trial_at = None
+
+class LocalHTTPLLM(LLM):
+    """Client for a llama.cpp server (`llama-server -m model.gguf`) or anything serving its /completion API"""
+
+    url: str = LOCAL_LLM_URL
+    max_tokens: int = MAX_NEW_TOKENS
+    temperature: float = TEMPERATURE
+    timeout: float = REQUEST_DEADLINE
+
+    @property
+    def _llm_type(self):
+        return "llamacpp-http"
+
+    def _payload(self, prompt, stop, stream):
+        return {"prompt": prompt, "n_predict": self.max_tokens, "temperature": self.temperature,
+                "stop": stop or [], "stream": stream}
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        response = requests.post(f"{self.url}/completion", json=self._payload(prompt, stop, False), timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()["content"]
+
+    def _stream(self, prompt, stop=None, run_manager=None, **kwargs):
+        with requests.post(f"{self.url}/completion", json=self._payload(prompt, stop, True),
+                           timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line.startswith(b"data: "):
+                    continue
+                event = json.loads(line[len(b"data: "):])
+                if event.get("content"):
+                    yield GenerationChunk(text=event["content"])
+                if event.get("stop"):
+                    break
+
+class ResilientLLM(LLM):
+    """Sends each prompt to the first healthy backend, with deadlines, retries, hedging and failover.
+
+    Backends are tried in the order given; one whose circuit breaker is open
+    is skipped, so traffic shifts to the fallback while the primary is
+    failing. If no token has arrived after `hedge_after` seconds a second
+    request is sent, to the fallback if there is one, and whichever answers
+    first is used. A request that fails before its first token moves on to
+    the next backend, and after a full round the call is retried with
+    jittered backoff, all within `deadline`. Errors after the first token
+    are raised, since the caller may already have shown part of the answer.
+    """
+
+    backends: dict  # name -> LLM, most preferred first
+    breakers: dict = Field(default_factory=dict)
+    deadline: float = REQUEST_DEADLINE
+    retries: int = MAX_RETRIES
+    hedge_after: float = HEDGE_AFTER
+    stats: dict = Field(default_factory=lambda: {"calls": 0, "retries": 0, "hedged": 0, "hedge_wins": 0,
+                                                 "fallbacks": 0, "timeouts": 0, "failures": 0})
+
+    @property
+    def _llm_type(self):
+        return "resilient"
+
+    def get_stats(self):
+        """Return call counters and the state of every backend's circuit breaker"""
+        return dict(self.stats, breakers={name: breaker.state for name, breaker in self.breakers.items()})
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        return "".join(self._tokens(prompt, stop, run_manager, whole_deadline=True))
+
+    def _stream(self, prompt, stop=None, run_manager=None, **kwargs):
+        for token in self._tokens(prompt, stop, run_manager, whole_deadline=False):
+            yield GenerationChunk(text=token)
+
+    def _pick(self, names):
+        """Take the first of names whose breaker lets a request through, or None"""
+        while names:
+            name = names.pop(0)
+            if self.breakers[name].allow():
+                return name
+        return None
+
+    def _produce(self, name, prompt, stop, deadline, out, key, cancelled):
+        """Stream one backend's tokens into out as (key, token, error); (key, None, None) marks the end"""
+        breaker, started = self.breakers[name], False
+        try:
+            for chunk in self.backends[name].stream(prompt, stop=stop):
+                if not started:
+                    started = True
+                    # An answer that starts after the deadline is thrown away, so it counts against the backend
+                    late = time.monotonic() > deadline
+                    if late:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                    metrics.increment("vedabot_llm_requests_total", backend=name, outcome="late" if late else "ok")
+                if cancelled.is_set():
+                    return
+                out.put((key, chunk, None))
+            if not started:
+                breaker.record_success()
+                metrics.increment("vedabot_llm_requests_total", backend=name, outcome="ok")
+            out.put((key, None, None))
+        except Exception as e:
+            if not started:
+                breaker.record_failure()
+                metrics.increment("vedabot_llm_requests_total", backend=name, outcome="error")
+            out.put((key, None, e))
+
+    def _tokens(self, prompt, stop, run_manager, whole_deadline):
+        self.stats["calls"] += 1
+        deadline = time.monotonic() + self.deadline
+        out = queue.Queue()
+        requests_sent = []  # (backend name, cancel event) per request, indexed by key
+        in_flight = set()
+
+        def send(name):
+            key = len(requests_sent)
+            cancelled = threading.Event()
+            requests_sent.append((name, cancelled))
+            in_flight.add(key)
+            threading.Thread(target=self._produce, args=(name, prompt, stop, deadline, out, key, cancelled),
+                             name=f"vedabot-llm-{name}", daemon=True).start()
+
+        def cancel_all(keep=None):
+            for key, (_, cancelled) in enumerate(requests_sent):
+                if key != keep:
+                    cancelled.set()
+
+        primary = next(iter(self.backends))
+        attempt, hedged, hedges = 0, False, set()
+        round_names = list(self.backends)
+        name = self._pick(round_names)
+        while True:
+            if name is None:
+                raise RuntimeError("All LLM backends are unavailable (circuit breakers open)")
+            if name != primary:
+                self.stats["fallbacks"] += 1
+            send(name)
+            winner = None
+            while winner is None and in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    cancel_all()
+                    self.stats["timeouts"] += 1
+                    raise TimeoutError(f"No answer from the LLM within {self.deadline:.0f}s")
+                try:
+                    key, token, error = out.get(timeout=remaining if hedged else min(remaining, self.hedge_after))
+                except queue.Empty:
+                    if not hedged:
+                        # Hedge on a healthy backend not yet tried this round if there is one, otherwise repeat the request
+                        hedged = True
+                        self.stats["hedged"] += 1
+                        hedges.add(len(requests_sent))
+                        send(self._pick(round_names) or requests_sent[-1][0])
+                    continue
+                if error is None:
+                    winner = key
+                else:
+                    in_flight.discard(key)
+                    logging.warning(f"LLM backend {requests_sent[key][0]} failed: {str(error)}")
+            if winner is not None:
+                break
+            # Every request so far failed before answering: fail over, or retry after a backoff.
+            # The new request gets its own hedge.
+            hedged = False
+            name = self._pick(round_names)
+            if name is None:
+                if attempt == self.retries:
+                    self.stats["failures"] += 1
+                    raise error
+                attempt += 1
+                self.stats["retries"] += 1
+                time.sleep(min(RETRY_BASE_DELAY * 2 ** (attempt - 1) * random.uniform(0.5, 1.5),
+                               max(0.0, deadline - time.monotonic())))
+                round_names = list(self.backends)
+                name = self._pick(round_names)
+
+        if winner in hedges:
+            self.stats["hedge_wins"] += 1
+        cancel_all(keep=winner)
+        while True:
+            if token is None:
+                return
+            if whole_deadline and time.monotonic() > deadline:
+                cancel_all()
+                self.stats["timeouts"] += 1
+                raise TimeoutError(f"The LLM answer took longer than {self.deadline:.0f}s")
+            if run_manager is not None:
+                run_manager.on_llm_new_token(token)
+            yield token
+            while True:
+                try:
+                    key, token, error = out.get(timeout=self.deadline)
+                except queue.Empty:
+                    cancel_all()
+                    raise TimeoutError(f"The LLM stream stalled for {self.deadline:.0f}s")
+                if key != winner:
+                    continue
+                if error is not None:
+                    raise error
+                break
+
+def load_backend(name):
+    """Create the client for one generation backend"""
+    if name == "hosted":
+        from langchain_huggingface import HuggingFaceEndpoint
+        return HuggingFaceEndpoint(
+            repo_id=LLM_MODEL,
+            huggingfacehub_api_token=os.getenv("HUGGINGFACEHUB_ACESS_TOKEN"),
+            max_new_tokens=MAX_NEW_TOKENS,
+            temperature=TEMPERATURE,
+            timeout=int(REQUEST_DEADLINE),
+            model_kwargs={"max_length": 64},
+        )
+    if name == "llamacpp":
+        try:
+            from langchain_community.llms import LlamaCpp
+        except ImportError as e:
+            raise ImportError("The llamacpp backend needs llama-cpp-python: pip install llama-cpp-python") from e
+        return LlamaCpp(model_path=LOCAL_MODEL_PATH, max_tokens=MAX_NEW_TOKENS, temperature=TEMPERATURE,
+                        n_ctx=4096, n_threads=os.cpu_count(), verbose=False)
+    if name == "http":
+        return LocalHTTPLLM()
+    raise ValueError(f"Unknown LLM backend {name!r}, expected one of {', '.join(BACKENDS)}")
+
+def load_llm(backend=None, fallback=None):
+    """Load the generation backend (default LLM_BACKEND) with its fallback (default FALLBACK_BACKEND)"""
+    names = [backend or LLM_BACKEND]
+    fallback = fallback or FALLBACK_BACKEND
+    if fallback and fallback not in names:
+        names.append(fallback)
+    return ResilientLLM(
+        backends={name: load_backend(name) for name in names},
+        breakers={name: CircuitBreaker(name) for name in names},
+    )
@@ -0,0 +1,247 @@
+import os
+import re
+import shutil
+import sqlite3
+import threading
+from collections import defaultdict
+from langchain_core.documents import Document
+from bm25 import tokenize
+from chunking import herb_key
+
+LOOKUP_FILE = "lookup.sqlite"
+MAX_MONOGRAPHS = 2  # herbs with more monographs than this (e.g. several plant parts) are left to the LLM
+MAX_SECTION_CHARS = 1200  # longer sections are summarized by the LLM instead of quoted
+MAX_NAME_WORDS = 4
+ALIAS_LANGUAGES = ("Sanskrit", "English", "Hindi")  # synonym lines whose names also identify a herb
+
+# What a lookup can ask about: the words that ask for it and the monograph sections that answer it
+INTENTS = {
+    "dose": ({"dose", "doses", "dosage", "quantity", "much"}, ["DOSE", "ANUPANA"]),
+    "uses": ({"use", "uses", "used", "benefit", "benefits", "good", "indication", "indications", "indicated",
+              "treat", "treats", "therapeutic"}, ["THERAPEUTIC USES"]),
+    "properties": ({"property", "properties", "action", "actions", "rasa", "guna", "virya", "vipaka", "karma",
+                    "qualities"}, ["PROPERTIES AND ACTION"]),
+    "precautions": ({"precaution", "precautions", "contraindication", "contraindications", "contraindicated",
+                     "side", "effects", "avoid", "safe", "safety"}, ["PRECAUTIONS", "CONTRA-INDICATIONS"]),
+    "formulations": ({"formulation", "formulations", "preparations", "products"}, ["IMPORTANT FORMULATIONS"]),
+    "synonyms": ({"synonym", "synonyms", "names", "called", "known"}, ["SYNONYMS", "REGIONAL LANGUAGE NAMES"]),
+    "constituents": ({"constituent", "constituents", "chemical", "chemicals", "compounds", "contains"},
+                     ["CONSTITUENTS"]),
+}
+# The only words a lookup may carry besides the herb and what is asked about;
+# any other word, e.g. "children" or a condition, may change the answer
+FILLER_WORDS = frozenset("""
+ayurveda ayurvedic herb herbs plant drug medicine tell give list main please some s per day daily recommended
+take taking taken
+""".split())
+
+# The API volumes set transliterated Sanskrit in a legacy font whose diacritic
+# letters come out of the PDF as Latin-1 glyphs, e.g. "Gu·£c¢" for Guḍūcī
+LEGACY_GLYPHS = str.maketrans({
+    "¡": "ā", "¢": "ī", "£": "ū", "¤": "ṛ", "À": "ṣ", "¸": "ṇ", "·": "ḍ", "¶": "ṭ", "´": "ṅ", "¿": "ś",
+    "á": "Ś", "Æ": "ṃ", "Å": "ḥ", "®": "e", "Ë": "Ā", "Ì": "Ī", "Í": "Ū", "Î": "Ṛ", "â": "Ṣ", "Û": "Ṇ",
+    "Ú": "Ḍ", "Ù": "Ṭ", "×": "Ṅ", "Ø": "Ñ",
+})
+# ñ and o share their glyphs with the micro and degree signs, so only count inside a word
+_LEGACY_IN_WORD = re.compile(r"(?<=[^\W\d_])([µ°])")
+_UNMAPPED_GLYPH = re.compile(r"[\u00a1-\u00ff]")
+_KEEP = frozenset("µ°½±ñÑ")  # Latin-1 characters that are real symbols, or what the glyphs map to
+
+def fix_glyphs(text):
+    """Turn the legacy font's glyphs back into Unicode transliteration, or return None if some are unknown"""
+    text = _LEGACY_IN_WORD.sub(lambda m: {"µ": "ñ", "°": "o"}[m.group(1)], text.translate(LEGACY_GLYPHS))
+    if any(char not in _KEEP for char in _UNMAPPED_GLYPH.findall(text)):
+        return None
+    return text
+
+_TABLE_ROW = re.compile(r"^[^\W\d][^:]{0,24}\s:\s")
+
+class LookupWriter:
+    """Writes the lookup index during ingest, one file's monograph sections at a time.
+
+    Rows go to a copy of the index and are committed per file, so they don't
+    pile up in memory; finish() rebuilds the name table, monograph names plus
+    the synonyms listed under ALIAS_LANGUAGES, and swaps the copy in, so the
+    app never reads a half-written index. The rows of removed files, or of
+    every file with replace, are dropped first.
+    """
+
+    def __init__(self, path, removed=(), replace=False):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        if not replace and os.path.exists(path):
+            shutil.copyfile(path, self.tmp_path)
+        self.connection = sqlite3.connect(self.tmp_path)
+        with self.connection as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS sections (file TEXT, shard TEXT, herb TEXT, monograph TEXT, "
+                "section TEXT, page INTEGER, source TEXT, volume TEXT, text TEXT)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS sections_herb ON sections (herb)")
+            connection.execute("CREATE TABLE IF NOT EXISTS names (name TEXT PRIMARY KEY, herb TEXT)")
+            connection.executemany("DELETE FROM sections WHERE file = ?", ((name,) for name in removed))
+
+    def add(self, name, rows):
+        """Store one file's sections as rows of (shard, monograph, section, page, source, volume, text)"""
+        with self.connection as connection:
+            connection.execute("DELETE FROM sections WHERE file = ?", (name,))
+            connection.executemany(
+                "INSERT INTO sections VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                ((name, shard, herb_key(monograph), monograph, section, page, source, volume, text)
+                 for shard, monograph, section, page, source, volume, text in rows),
+            )
+
+    def finish(self):
+        """Rebuild the name table and replace the live index with the new one"""
+        with self.connection as connection:
+            herbs = {herb for (herb,) in connection.execute("SELECT DISTINCT herb FROM sections") if herb}
+            aliases = defaultdict(set)
+            for herb, text in connection.execute("SELECT herb, text FROM sections WHERE section = 'SYNONYMS'"):
+                for alias in _synonyms(text):
+                    if alias not in herbs:
+                        aliases[alias].add(herb)
+            connection.execute("DELETE FROM names")
+            connection.executemany("INSERT INTO names VALUES (?, ?)", ((herb, herb) for herb in herbs))
+            # A synonym shared by several herbs doesn't identify any of them
+            connection.executemany("INSERT INTO names VALUES (?, ?)",
+                                   ((alias, min(owners)) for alias, owners in aliases.items() if len(owners) == 1))
+        self.connection.close()
+        os.replace(self.tmp_path, self.path)
+
+def write_lookup(path, sections, removed=(), replace=False):
+    """Update the lookup index in one go; sections maps a file name to its rows as in LookupWriter.add"""
+    writer = LookupWriter(path, removed, replace)
+    for name, rows in sections.items():
+        writer.add(name, rows)
+    writer.finish()
+
+def _synonyms(text):
+    """Names listed on the ALIAS_LANGUAGES lines of a SYNONYMS section"""
+    names = set()
+    for line in text.splitlines():
+        language, _, listed = line.partition(":")
+        if language.strip() not in ALIAS_LANGUAGES:
+            continue
+        for name in re.split(r"[,;]", listed):
+            name = herb_key(name)
+            if len(name) >= 4 and len(name.split()) <= MAX_NAME_WORDS:
+                names.add(name)
+    return names
+
+def _section_markdown(section, text):
+    """Render one section, dropping its heading and undoing the PDF's line breaks"""
+    text = re.sub(r"^" + re.escape(section) + r"\s*:?\s*", "", text.strip(), flags=re.IGNORECASE)
+    lines = [" ".join(line.split()) for line in text.splitlines() if line.strip()]
+    title = section.capitalize()
+    # "Rasa : Katu" style tables, with wrapped values continuing on the next line
+    items = []
+    for line in lines:
+        if _TABLE_ROW.match(line):
+            items.append(list(line.partition(":")[::2]))
+        elif items:
+            items[-1][1] += " " + line
+    if len(items) > 1 and _TABLE_ROW.match(lines[0]):
+        return f"**{title}:**\n" + "\n".join(f"- **{key.strip()}**: {value.strip()}" for key, value in items)
+    return f"**{title}:** {' '.join(lines)}"
+
+def find_names(question, names):
+    """Return the herbs named in a question, given names mapping each known name to its herb, and the words used"""
+    words = herb_key(question).split()
+    found, used = set(), set()
+    i = 0
+    while i < len(words):
+        for n in range(min(MAX_NAME_WORDS, len(words) - i), 0, -1):
+            herb = names.get(" ".join(words[i:i + n]))
+            if herb is not None:
+                found.add(herb)
+                used.update(words[i:i + n])
+                i += n - 1
+                break
+        i += 1
+    return found, used
+
+class LookupIndex:
+    """Answers direct herb lookups ("dose of Amalaki") from the monograph sections.
+
+    A question counts as a lookup only if it names exactly one herb or
+    formulation, asks about exactly one thing in INTENTS, and has no other
+    words but FILLER_WORDS; anything else returns None and goes through
+    retrieval and the LLM as usual.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self.names = dict(self.connection.execute("SELECT name, herb FROM names"))
+        self._triggers = {word: intent for intent, (words, _) in INTENTS.items() for word in words}
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            self._local.connection = connection
+        return connection
+
+    def match(self, question):
+        """Return (herb, intent) if the question is a plain lookup, else None"""
+        words = herb_key(question).split()
+        found, used = find_names(question, self.names)
+        intents = {self._triggers[word] for word in words if word in self._triggers}
+        if len(found) != 1 or len(intents) != 1:
+            return None
+        intent = intents.pop()
+        if any(
+            word not in used and word not in INTENTS[intent][0] and word not in FILLER_WORDS
+            for word in tokenize(" ".join(words))
+        ):
+            return None
+        return found.pop(), intent
+
+    def answer(self, question, accept=None):
+        """Answer a lookup from the monograph sections, or return None to leave it to the LLM.
+
+        accept, if given, is called with each section's metadata and drops
+        sections it rejects, e.g. to apply a search filter.
+        """
+        match = self.match(question)
+        if match is None:
+            return None
+        herb, intent = match
+        sections = INTENTS[intent][1]
+        rows = self.connection.execute(
+            f"SELECT monograph, section, page, source, volume, shard, text FROM sections "
+            f"WHERE herb = ? AND section IN ({', '.join('?' * len(sections))}) ORDER BY volume, page",
+            (herb, *sections),
+        ).fetchall()
+        monographs = defaultdict(list)
+        for monograph, section, page, source, volume, shard, text in rows:
+            metadata = {"source": source, "volume": volume, "page": page, "herb": herb,
+                        "monograph": monograph, "section": section, "shard": shard}
+            if accept is None or accept(metadata):
+                content = fix_glyphs(f"{monograph}\n{text}")
+                if content is None:
+                    # Glyphs we can't map would be shown garbled without the LLM to read past them
+                    return None
+                monographs[(monograph, source)].append(Document(page_content=content, metadata=metadata))
+        if not monographs or len(monographs) > MAX_MONOGRAPHS:
+            return None
+        parts, docs = [], []
+        for (monograph, _), found in monographs.items():
+            found.sort(key=lambda doc: sections.index(doc.metadata["section"]))
+            if any(len(doc.page_content) > MAX_SECTION_CHARS for doc in found):
+                return None
+            parts.append(f"#### {found[0].page_content.split(chr(10), 1)[0]}")
+            parts += [_section_markdown(doc.metadata["section"], doc.page_content.split("\n", 1)[1]) for doc in found]
+            docs += found
+        return {"result": "\n\n".join(parts), "source_documents": docs, "lookup": {"herb": herb, "intent": intent}}
+
+def load_lookup(folder):
+    """Open the lookup index saved by ingest, or None if there is none"""
+    path = os.path.join(folder, LOOKUP_FILE)
+    return LookupIndex(path) if os.path.exists(path) else None
@@ -1,17 +1,81 @@
 # model.py
 import os
+import asyncio
+import json
+import contextvars
+import functools
+import heapq
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+import faiss
+import numpy as np
 from langchain.prompts import PromptTemplate
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEndpoint
-from langchain.chains import RetrievalQA
+from cache import AnswerCache, normalize_question
+from chunking import herb_key
+from context import pack_context
+from conversation import HISTORY_TURNS, condense_question, format_history
+from embedding_backends import EMBEDDING_BACKEND, load_embeddings as load_embedding_backend
+from llm_backends import load_llm as load_llm_backend
+from lookup import load_lookup
+from store import ShardSet
+import metrics
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Configure logging; DEBUG logs every request's stage timings
+logging.basicConfig(level=os.getenv("VEDABOT_LOG_LEVEL", "INFO"))
 
 # Constants
 DB_FAISS_PATH = 'vectorstore/db_faiss'
+RELOAD_CHECK_INTERVAL = 5.0  # seconds between checks for a rebuilt index
+RETRIEVAL_K = 2
+FAISS_NPROBE = 16  # inverted lists scanned per query on IVF indexes
+FAISS_EF_SEARCH = 64  # candidate list size per query on HNSW indexes
+HYBRID_SEARCH = True  # fuse BM25 keyword hits with the dense hits
+CANDIDATE_POOL = 20  # hits taken from each retriever before fusion
+RRF_K = 60  # reciprocal rank fusion damping constant
+BM25_BUDGET_MS = 20
+RERANK_MODEL = None  # e.g. "cross-encoder/ms-marco-MiniLM-L-6-v2" to rerank fused hits
+RERANK_POOL = 10  # fused candidates scored by the reranker
+RERANK_BUDGET_MS = 40
+FILTER_FETCH_K = 200  # dense hits scanned for matches when search is filtered by metadata
+MAX_LOADED_SHARDS = 8  # shards kept open at once, least recently searched closed first
+SHARD_IDLE_SECONDS = 1800  # shards not searched for this long are closed
+SHARD_SEARCH_WORKERS = 4  # threads searching shards in parallel
+MANIFEST_FILE = 'manifest.json'
+ANSWER_CACHE_PATH = 'cache/answer_cache.sqlite'
+ANSWER_CACHE_THRESHOLD = 0.92  # cosine similarity for paraphrased questions
+ANSWER_CACHE_TTL = 7 * 24 * 3600
+ANSWER_CACHE_SIZE = 1000
+QUERY_WORKERS = 8  # threads for embedding and FAISS search
+MAX_INFLIGHT_LLM_CALLS = 8
+MAX_QUEUED_QUERIES = 64  # questions waiting for an LLM slot before new ones are refused
+REFERENCE_CHARS = 200  # source excerpt shown under each reference
+EXTRACTIVE_ANSWERS = True  # answer plain herb lookups from the monograph sections without the LLM
+
+# Process-wide registry holding the warm models, shards and lookup index
+_registry = {}
+_registry_lock = threading.RLock()
+
+# Recent query latencies, split by whether the registry had to be loaded first
+_query_latencies = {"cold": deque(maxlen=1000), "warm": deque(maxlen=1000)}
+# Time from question to first streamed token
+_first_token_latencies = deque(maxlen=1000)
+# How questions were answered: "extractive", "cache", "llm", "rejected" or "error"
+_route_counts = Counter()
+# Running estimate of reranker cost per candidate, used to stay within RERANK_BUDGET_MS
+_rerank_ms_per_pair = None
+
+_shard_executor = ThreadPoolExecutor(max_workers=SHARD_SEARCH_WORKERS, thread_name_prefix="vedabot-shard")
+
+answer_cache = AnswerCache(
+    ANSWER_CACHE_PATH,
+    threshold=ANSWER_CACHE_THRESHOLD,
+    ttl=ANSWER_CACHE_TTL,
+    max_entries=ANSWER_CACHE_SIZE,
+)
 
 # Template for the Ayurvedic advisor
 custom_prompt_template = """
@@ -20,6 +84,7 @@ medicines and remedies, ensure to include precautions and exceptions where neces
 Create a stand-alone question from follow-up questions while retaining context from the previous exchanges.
 Format the entire answer in markdown format, with bolds, italics, and pointers wherever required.
 Only return the helpful answer below and nothing else. For answers exceeding 120 tokens, answer in points.
+Previous exchanges: {chat_history}
 Context: {context}
 Question: {question}
 """
@@ -27,7 +92,8 @@ Question: {question}
 def set_custom_prompt():
     """Create and return a custom prompt template"""
     prompt = PromptTemplate(template=custom_prompt_template, 
-                          input_variables=["context", "question"])
+                          input_variables=["context", "question"],
+                          partial_variables={"chat_history": ""})
     return prompt
 
 def add_sources_to_answer(sources, answer):
@@ -41,251 +107,650 @@ def add_sources_to_answer(sources, answer):
 def format_source_content(source, i):
     """Format individual source content"""
     metadata = source.metadata
-    file_name = metadata["source"].split('\\')[-1].split(".pdf")[0]
-    page_content = source.page_content
+    file_name = os.path.splitext(os.path.basename(metadata["source"].replace("\\", "/")))[0]
+    if metadata.get("page") is not None:
+        file_name += f", p. {metadata['page'] + 1}"
+    if metadata.get("monograph"):
+        file_name += f" — {metadata['monograph']}"
+        if metadata.get("section"):
+            file_name += f" ({metadata['section']})"
+    page_content = " ".join(source.page_content.split())
+    if len(page_content) > REFERENCE_CHARS:
+        page_content = page_content[:REFERENCE_CHARS].rsplit(" ", 1)[0] + "…"
     formatted_content = f"##### {i}.{file_name}\n"
     formatted_content += f"Source Content: _{page_content}_\n"
     return formatted_content
 
-def retrieval_qa_chain(llm, prompt, db):
-    """Create a retrieval QA chain"""
-    qa_chain = RetrievalQA.from_chain_type(
-        llm=llm,
-        chain_type="stuff",
-        retriever=db.as_retriever(search_kwargs={"k": 2}),
-        return_source_documents=True,
-        chain_type_kwargs={"prompt": prompt},
-    )
-    return qa_chain
-
 def load_llm():
-    """Load and configure the language model"""
-    llm = HuggingFaceEndpoint(
-        repo_id="mistralai/Mistral-7B-Instruct-v0.2", 
-        huggingfacehub_api_token=os.getenv("HUGGINGFACEHUB_ACESS_TOKEN"), 
-        max_new_tokens=1024,
-        temperature=0.1,
-        model_kwargs={"max_length": 64} 
+    """Load the language model behind the deadline, retry, hedging and fallback layer"""
+    return load_llm_backend()
+
+def load_embeddings(backend=None):
+    """Load the sentence embedding model on the given backend (default the configured one)"""
+    return load_embedding_backend(backend)
+
+def _index_embedding_backend():
+    """The embedding backend the index was built with, from the ingest manifest, or None"""
+    try:
+        with open(os.path.join(DB_FAISS_PATH, MANIFEST_FILE)) as file:
+            return json.load(file).get("embedding_backend", "torch")
+    except (OSError, ValueError):
+        return None
+
+def load_reranker():
+    """Load the cross-encoder reranker, if one is configured"""
+    if RERANK_MODEL is None:
+        return None
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(RERANK_MODEL, device="cpu")
+
+def tune_index(index):
+    """Apply the query-time recall/latency settings the index supports"""
+    params = faiss.ParameterSpace()
+    for name, value in (("nprobe", FAISS_NPROBE), ("efSearch", FAISS_EF_SEARCH)):
+        try:
+            params.set_index_parameter(index, name, value)
+        except RuntimeError:
+            # Not applicable to this index type, e.g. nprobe on a flat index
+            pass
+
+def load_vector_db(embeddings):
+    """Open the sharded FAISS store; shards themselves are loaded on first search"""
+    shards = ShardSet(DB_FAISS_PATH, embeddings, max_loaded=MAX_LOADED_SHARDS,
+                      idle_seconds=SHARD_IDLE_SECONDS, prepare=tune_index)
+    if not shards.names:
+        raise FileNotFoundError(f"No index found in {DB_FAISS_PATH}, run ingest.py first")
+    return shards
+
+def _index_signature():
+    """Fingerprint the index files of every shard so a rebuild on disk can be detected"""
+    if not os.path.isdir(DB_FAISS_PATH):
+        return None
+    signature = []
+    for root, dirs, files in os.walk(DB_FAISS_PATH):
+        dirs.sort()
+        for name in sorted(files):
+            stat = os.stat(os.path.join(root, name))
+            signature.append((os.path.relpath(os.path.join(root, name), DB_FAISS_PATH), stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+def _load_registry():
+    """Return the warm registry, building or reloading it when needed.
+
+    The LLM client is created once per process, and the embeddings model
+    again only if the index is rebuilt with another backend; the shard set
+    and lookup index are reopened only when the files under DB_FAISS_PATH
+    change. Returns the registry and whether any work was done.
+    """
+    with _registry_lock:
+        now = time.monotonic()
+        if "shards" in _registry and now - _registry["checked_at"] < RELOAD_CHECK_INTERVAL:
+            return _registry, False
+
+        signature = _index_signature()
+        _registry["checked_at"] = now
+        if "shards" in _registry and signature == _registry["signature"]:
+            return _registry, False
+
+        start = time.perf_counter()
+        # Queries must be embedded like the index was, whatever this process is configured with
+        backend = _index_embedding_backend() or EMBEDDING_BACKEND
+        embeddings = _registry.get("embeddings")
+        if _registry.get("embedding_backend") != backend:
+            if backend != EMBEDDING_BACKEND:
+                logging.warning(f"The index was built with the {backend} embedding backend, not the configured "
+                                f"{EMBEDDING_BACKEND}; embedding queries with {backend}")
+            with metrics.span("load_embeddings"):
+                embeddings = load_embeddings(backend)
+        if "llm" not in _registry:
+            with metrics.span("load_llm"):
+                _registry["llm"] = load_llm()
+            _registry["prompt"] = set_custom_prompt()
+            with metrics.span("load_reranker"):
+                _registry["reranker"] = load_reranker()
+        try:
+            with metrics.span("load_vector_db"):
+                shards = load_vector_db(embeddings)
+        except Exception as e:
+            if "shards" not in _registry:
+                raise
+            # Keep serving from the previous index, e.g. while ingest is still writing
+            logging.warning(f"Index reload failed, keeping previous index: {str(e)}")
+            return _registry, False
+
+        _registry["embeddings"], _registry["embedding_backend"] = embeddings, backend
+        _registry["shards"] = shards
+        _registry["lookup"] = load_lookup(DB_FAISS_PATH)
+        _registry["signature"] = signature
+        answer_cache.bind(signature)
+        logging.info(f"Chatbot loaded in {time.perf_counter() - start:.2f}s")
+        return _registry, True
+
+def warm_up():
+    """Load the models and index ahead of the first query"""
+    registry, cold = _load_registry()
+    if cold:
+        # Run the embedding model once so the first real query doesn't pay for it
+        registry["embeddings"].embed_query("warm up")
+
+def get_query_metrics():
+    """Summarize query latencies in seconds and cache hit counts"""
+    summary = {}
+    for kind, latencies in dict(_query_latencies, first_token=_first_token_latencies).items():
+        ordered = sorted(latencies)
+        summary[kind] = {
+            "count": len(ordered),
+            "mean": sum(ordered) / len(ordered) if ordered else None,
+            "p50": ordered[len(ordered) // 2] if ordered else None,
+            "max": ordered[-1] if ordered else None,
+        }
+    summary["answer_cache"] = dict(answer_cache.stats)
+    embeddings = _registry.get("embeddings")
+    if hasattr(embeddings, "stats"):
+        summary["query_embedding_cache"] = dict(embeddings.stats)
+    llm = _registry.get("llm")
+    if hasattr(llm, "get_stats"):
+        summary["llm"] = llm.get_stats()
+    answered = sum(_route_counts[route] for route in ("extractive", "cache", "llm"))
+    summary["routing"] = dict(
+        _route_counts,
+        llm_avoided=(_route_counts["extractive"] + _route_counts["cache"]) / answered if answered else None,
     )
-    return llm
+    shards = _registry.get("shards")
+    if shards is not None:
+        summary["shards"] = dict(shards.stats, loaded=shards.loaded, total=len(shards.names))
+    if _query_service is not None:
+        summary["query_service"] = _query_service.get_stats()
+    return summary
+
+ERROR_MESSAGE = "I apologize, but I encountered an error processing your question. Please try again."
+BUSY_MESSAGE = "Vedabot is handling a lot of questions right now. Please try again in a moment."
+
+def build_context(docs, question=None):
+    """Pack retrieved chunks into the prompt context within the token budget"""
+    with metrics.span("pack_context"):
+        return pack_context([doc.page_content for doc in docs], question)
 
-def create_chat_bot_chain():
-    """Create the complete chatbot chain"""
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2",
-        model_kwargs={'device': 'cpu'}
+def build_prompt(registry, question, query, docs, history=None):
+    """Fill the prompt with the packed context and the conversation so far"""
+    return registry["prompt"].format(
+        context=build_context(docs, query), question=question, chat_history=format_history(history)
     )
-    db = FAISS.load_local(DB_FAISS_PATH, embeddings, allow_dangerous_deserialization=True)    
-    llm = load_llm()
-    qa_prompt = set_custom_prompt()
-    qa_chain = retrieval_qa_chain(llm, qa_prompt, db)
-    return qa_chain
-
-def handle_query(question):
-    """Handle user queries"""
-    qa_chain = create_chat_bot_chain()
+
+def _chunk_id(doc):
+    return doc.id or doc.metadata.get("chunk_id")
+
+def _rerank(reranker, question, docs, k):
+    """Reorder docs with the cross-encoder, scoring only as many as fit the budget"""
+    global _rerank_ms_per_pair
+    pool = len(docs)
+    if _rerank_ms_per_pair:
+        pool = min(pool, max(k, int(RERANK_BUDGET_MS / _rerank_ms_per_pair)))
+    start = time.perf_counter()
+    with metrics.span("search.rerank"):
+        scores = reranker.predict([(question, doc.page_content) for doc in docs[:pool]])
+    elapsed = (time.perf_counter() - start) * 1000
+    per_pair = elapsed / pool
+    _rerank_ms_per_pair = per_pair if _rerank_ms_per_pair is None else 0.8 * _rerank_ms_per_pair + 0.2 * per_pair
+    reranked = [doc for _, doc in sorted(zip(scores, docs[:pool]), key=lambda item: item[0], reverse=True)]
+    return reranked + docs[pool:]
+
+def _matches(metadata, filter):
+    """Whether chunk metadata satisfies a filter such as {"volume": "API-Vol-1", "herb": ["arka", "bilva"]}"""
+    for key, wanted in filter.items():
+        if isinstance(wanted, (list, tuple, set)):
+            if metadata.get(key) not in wanted:
+                return False
+        elif metadata.get(key) != wanted:
+            return False
+    return True
+
+def _normalize_filter(filter):
+    """Normalize herb names in a filter the way chunking does"""
+    if not filter or "herb" not in filter:
+        return filter
+    herbs = filter["herb"]
+    herbs = [herb_key(herb) for herb in herbs] if isinstance(herbs, (list, tuple, set)) else herb_key(herbs)
+    return dict(filter, herb=herbs)
+
+def _select_shards(shards, filter):
+    """Shards a search covers: all of them, or those named by the filter's "shard" key"""
+    wanted = filter.get("shard") if filter else None
+    if wanted is None:
+        return shards.names
+    wanted = [wanted] if isinstance(wanted, str) else wanted
+    return [name for name in shards.names if name in wanted]
+
+def _fan_out(func, names):
+    """Call func on every shard name in parallel, returning results in the same order"""
+    if len(names) <= 1:
+        return [func(name) for name in names]
+    # Executor threads don't inherit contextvars, so pass the trace along explicitly
+    futures = [_shard_executor.submit(contextvars.copy_context().run, func, name) for name in names]
+    return [future.result() for future in futures]
+
+def _closest(hits, n):
+    """Merge (doc, L2 distance) hits from several shards into the n nearest docs"""
+    return [doc for doc, _ in heapq.nsmallest(n, hits, key=lambda hit: hit[1])]
+
+def search_chunks(registry, question, embedding, k=RETRIEVAL_K, dense=None, filter=None):
+    """Retrieve the top-k chunks for a question.
+
+    Every shard is searched in parallel and the hits are merged: dense FAISS
+    hits by distance and BM25 keyword hits by score. The two lists are then
+    fused by reciprocal rank fusion, so exact herb and formulation names
+    count even when the embedding misses them, and the fused list is
+    optionally reordered by a cross-encoder. BM25 and reranking each have a
+    latency budget and fall back to fewer candidates rather than slowing the
+    query down.
+
+    dense can pass in dense hits already found by search_chunks_batch, and
+    filter restricts results to chunks whose metadata matches, e.g.
+    {"volume": "API-Vol-1"}, {"herb": "Ashwagandha"} or {"shard":
+    "charaka_samhita"}; a "shard" filter also skips the other shards entirely.
+    """
+    shards = registry["shards"]
+    filter = _normalize_filter(filter)
+    filter_kwargs = {}
+    if filter:
+        filter_kwargs = {"filter": lambda metadata: _matches(metadata, filter), "fetch_k": FILTER_FETCH_K}
+    pool = CANDIDATE_POOL if HYBRID_SEARCH else k
+
+    def search(name):
+        db, bm25 = shards.get(name)
+        hits, lexical, fetched = [], None, {}
+        if dense is None:
+            with metrics.span("search.dense"):
+                hits = db.similarity_search_with_score_by_vector(embedding, k=pool, **filter_kwargs)
+        if HYBRID_SEARCH and bm25 is not None:
+            with metrics.span("search.bm25"):
+                lexical = bm25.search(question, pool, budget_ms=BM25_BUDGET_MS)
+            if filter:
+                # BM25 doesn't know about metadata, so drop keyword hits outside the filter
+                fetched = {chunk_id: db.docstore.search(chunk_id) for chunk_id, _ in lexical}
+                fetched = {chunk_id: doc for chunk_id, doc in fetched.items() if _matches(doc.metadata, filter)}
+                lexical = [(chunk_id, score) for chunk_id, score in lexical if chunk_id in fetched]
+        return db, hits, lexical, fetched
+
+    with metrics.span("search.shards"):
+        results = _fan_out(search, _select_shards(shards, filter))
+    if dense is None:
+        dense = _closest([hit for _, hits, _, _ in results for hit in hits], pool)
+    if all(lexical is None for _, _, lexical, _ in results):
+        return dense[:k]
+
+    docs, owners, lexical = {}, {}, []
+    for db, _, hits, fetched in results:
+        docs.update(fetched)
+        for chunk_id, score in hits or ():
+            owners[chunk_id] = db
+            lexical.append((chunk_id, score))
+    # BM25 scores from different shards are comparable enough to merge: same
+    # parameters, with term weights from each shard's own corpus
+    lexical.sort(key=lambda hit: hit[1], reverse=True)
+
+    scores = {}
+    for rank, doc in enumerate(dense):
+        docs[_chunk_id(doc)] = doc
+        scores[_chunk_id(doc)] = 1 / (RRF_K + rank + 1)
+    for rank, (chunk_id, _) in enumerate(lexical[:pool]):
+        scores[chunk_id] = scores.get(chunk_id, 0.0) + 1 / (RRF_K + rank + 1)
+    reranker = registry.get("reranker")
+    ranked = sorted(scores, key=scores.get, reverse=True)[:max(k, RERANK_POOL) if reranker else k]
+    with metrics.span("search.fetch"):
+        for chunk_id in ranked:
+            if chunk_id not in docs:
+                docs[chunk_id] = owners[chunk_id].docstore.search(chunk_id)
+    candidates = [docs[chunk_id] for chunk_id in ranked]
+    if reranker is not None:
+        candidates = _rerank(reranker, question, candidates, k)
+    return candidates[:k]
+
+def search_chunks_batch(registry, questions, embeddings, k=RETRIEVAL_K, filter=None):
+    """Retrieve the top-k chunks for many questions with a single FAISS search per shard"""
+    shards = registry["shards"]
+    filter = _normalize_filter(filter)
+    pool = CANDIDATE_POOL if HYBRID_SEARCH else k
+    vectors = np.asarray(embeddings, dtype=np.float32)
+
+    def search(name):
+        db, _ = shards.get(name)
+        distances, positions = db.index.search(vectors, FILTER_FETCH_K if filter else pool)
+        results = []
+        for row_distances, row_positions in zip(distances, positions):
+            hits = [
+                (db.docstore.search(db.index_to_docstore_id[int(position)]), float(distance))
+                for distance, position in zip(row_distances, row_positions) if position != -1
+            ]
+            if filter:
+                hits = [hit for hit in hits if _matches(hit[0].metadata, filter)][:pool]
+            results.append(hits)
+        return results
+
+    with metrics.span("search.dense_batch"):
+        per_shard = _fan_out(search, _select_shards(shards, filter))
+    results = []
+    for i, (question, embedding) in enumerate(zip(questions, embeddings)):
+        dense = _closest([hit for hits in per_shard for hit in hits[i]], pool)
+        results.append(search_chunks(registry, question, embedding, k, dense=dense, filter=filter))
+    return results
+
+def answer_directly(registry, question, filter=None):
+    """Answer a plain herb lookup from the monograph sections, or return None if it needs the LLM"""
+    lookup = registry.get("lookup")
+    if not EXTRACTIVE_ANSWERS or lookup is None:
+        return None
+    filter = _normalize_filter(filter)
+    with metrics.span("extractive"):
+        return lookup.answer(question, (lambda metadata: _matches(metadata, filter)) if filter else None)
+
+def _retrieve(question, history=None, filter=None):
+    """Condense and embed a question, then return a ready response or the retrieved chunks.
+
+    Returns (registry, cold, query, embedding, cached, docs) where query is
+    the stand-alone form of the question used for search and the cache, and
+    exactly one of cached and docs is set. cached is a response that needs
+    no LLM call: an extractive answer to a plain herb lookup, which skips
+    embedding too, or a hit in the answer cache; its "route" says which.
+    The same embedding serves the cache lookup and the search. Filtered
+    searches skip the answer cache.
+    """
+    registry, cold = _load_registry()
+    # A lookup that stands on its own is answered as asked, before condensing can prefix earlier turns
+    direct = answer_directly(registry, question, filter)
+    query = question
+    if direct is None:
+        with metrics.span("condense"):
+            lookup = registry.get("lookup")
+            query = condense_question(question, history, registry["llm"], lookup.names if lookup else None)
+        if query != question:
+            direct = answer_directly(registry, query, filter)
+    if direct is not None:
+        return registry, cold, query, None, dict(direct, query=question, route="extractive"), None
+    with metrics.span("embed"):
+        embedding = registry["embeddings"].embed_query(query)
+    cached = None
+    if not filter:
+        with metrics.span("cache_lookup"):
+            cached = answer_cache.lookup(query, embedding)
+    if cached is not None:
+        return registry, cold, query, embedding, cached, None
+    docs = search_chunks(registry, query, embedding, filter=filter)
+    return registry, cold, query, embedding, None, docs
+
+def _finish_trace(trace, response, route):
+    """Attach the trace id, stage timings and route to a response and count it"""
+    response["trace_id"] = trace.trace_id
+    response["route"] = route
+    _route_counts[route] += 1
+    response["timings"] = trace.timings()
+    metrics.increment("vedabot_queries_total", route=route)
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug(f"[{trace.trace_id}] {route} query timings: {response['timings']}")
+    return response
+
+def _complete(trace, start, cold, response, route, cache_key=None):
+    """Record a finished answer: cache it under cache_key, (query, embedding), if given, then time and trace it"""
+    if cache_key is not None:
+        answer_cache.store(*cache_key, response)
+    _query_latencies["cold" if cold else "warm"].append(time.perf_counter() - start)
+    return _finish_trace(trace, response, route)
+
+def handle_query(question, history=None, filter=None):
+    """Handle user queries.
+
+    history is the session's earlier turns, oldest first, as dicts with
+    "question" and "answer"; follow-ups are condensed against it and the
+    recent turns are included in the prompt. filter restricts retrieval by
+    chunk metadata, as in search_chunks.
+    """
+    start = time.perf_counter()
+    trace = metrics.start_trace()
     try:
-        response = qa_chain({'query': question})
-        return response
+        registry, cold, query, embedding, cached, docs = _retrieve(question, history, filter)
+        if cached is not None:
+            return _complete(trace, start, cold, cached, cached.get("route", "cache"))
+        prompt = build_prompt(registry, question, query, docs, history)
+        with metrics.span("generate"):
+            result = registry["llm"].invoke(prompt)
+        response = {"query": question, "result": result, "source_documents": docs}
+        return _complete(trace, start, cold, response, "llm", None if filter else (query, embedding))
     except Exception as e:
-        logging.error(f"Error processing query: {str(e)}")
-        return {"result": "I apologize, but I encountered an error processing your question. Please try again."}
+        logging.error(f"[{trace.trace_id}] Error processing query: {str(e)}")
+        return _finish_trace(trace, {"result": ERROR_MESSAGE}, "error")
 
-# app.py
-import streamlit as st
-import os
-import json
-from datetime import datetime
-from dotenv import load_dotenv
-from model import handle_query
-
-def load_chat_history():
-    """Load chat history from JSON file"""
-    if os.path.exists("chat_history.json"):
-        with open("chat_history.json", "r") as file:
-            return json.load(file)
-    return []
-
-def save_chat_history(chat_history):
-    """Save chat history to JSON file"""
-    with open("chat_history.json", "w") as file:
-        json.dump(chat_history, file)
-
-def format_response(response_data):
-    """Format the response with Ayurvedic styling"""
-    result = response_data.get('result', '')
-    formatted_result = f"""
-    <div class="response-container">
-    ### 🌿 Ayurvedic Insights
-    {result}
-
-    ---
-    **Note:** These remedies are complementary. Consult a healthcare provider for persistent issues.
-    </div>
+class _SharedStream:
+    """One streamed answer in flight, fanned out to every caller asking the same question.
+
+    Tokens are kept so a caller that joins late first gets what was already
+    generated; `response` is set once the answer is complete.
     """
-    return formatted_result
-
-def clear_chat_history():
-    """Clear the chat history file"""
-    if os.path.exists("chat_history.json"):
-        os.remove("chat_history.json")
-
-def load_css(file_name):
-    """Load custom CSS styles"""
-    if os.path.exists(file_name):
-        with open(file_name) as f:
-            st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
-    else:
-        st.warning(f"CSS file '{file_name}' not found. Default styles applied.")
-
-def main():
-    """Main application function"""
-    # Load environment variables
-    load_dotenv()
-    
-    # Configure Streamlit page
-    st.set_page_config(
-        page_title="Vedabot - Your Health Companion",
-        page_icon=":books:",
-        layout="wide",
-        initial_sidebar_state="collapsed",
-    )
-    
-    # Load custom CSS
-    load_css("style.css")
-    
-    # Load chat history
-    chat_history = load_chat_history()
-
-    # Header section
-    st.markdown("""
-    <div class="main-header">
-        <div class="header-content">
-            <div class="logo-container">
-                <img src="https://www.pngarts.com/files/12/Ayurveda-Logo-PNG-Photo.png" 
-                     class="circular-logo">
-            </div>
-            <div class="title-container">
-                <h1>Welcome to Vedabot</h1>
-                <h2>Your Home Remedies Buddy</h2>
-                <p class="explore-text">Explore health solutions based on Ayurvedic knowledge</p>
-            </div>
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
-
-    # Sidebar content
-    with st.sidebar:
-        st.title("Vedabot")
-        st.markdown("Your Ayurvedic Chatbot Assistant :herb:")
-        st.image("https://t4.ftcdn.net/jpg/07/22/93/81/360_F_722938112_xunuELGTYPe4cb2JNKQRddTaghih3nfj.jpg", 
-                use_container_width=True)
-        
-        st.info("""**Instructions:**
-        - Enter your query related to health.
-        - Receive Ayurvedic insights.
-        - In case of severe problem consult the Doctor""")
-
-        if chat_history:
-            st.markdown("### 💬 Chat History")
-            for chat in chat_history:
-                time_display = chat.get('time', 'Time Not Available')
-                question_display = chat.get('question', 'Question Not Available')
-                st.markdown(f"**{time_display}** - {question_display}")
-
-            if st.button("Clear Chat History"):
-                clear_chat_history()
-                st.success("Chat History has been cleared.")
-
-    # Main content layout
-    col1, col2 = st.columns([2, 1])
-
-    with col1:
-        st.markdown("<div style='margin-top: 20px;'></div>", unsafe_allow_html=True)
-        question = st.text_input(
-            "Ask your health-related question here:",
-            placeholder="e.g., What are Ayurvedic remedies for cold?"
-        )
-
-        if st.button("Submit", key="submit_button", help="Click to get Ayurvedic insights") and question.strip():
-            with st.spinner("Finding the best Ayurvedic insights..."):
-                response_data = handle_query(question)
-                
-            if response_data:
-                formatted_response = format_response(response_data)
-                st.markdown(formatted_response, unsafe_allow_html=True)
-                
-                chat_entry = {
-                    "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "question": question
-                }
-                chat_history.append(chat_entry)
-                save_chat_history(chat_history)
-            else:
-                st.warning("No relevant insights found. Please refine your query.")
-    
-    with col2:
-        # Image grid
-        st.markdown('<div class="image-grid">', unsafe_allow_html=True)
-        
-        # Row 1
-        cols = st.columns(2)
-        with cols[0]:
-            st.markdown("""
-            <div class="image-container">
-                <img src="https://media.istockphoto.com/id/697860312/photo/indian-ayurvedic-dietary-supplement-called-chyawanprash-chyavanaprasha-is-a-cooked-mixture-of.jpg?s=612x612&w=0&k=20&c=outabsxtvdSSt4aCkRdjtKrVtv7qko4N6AMA6qVtWmo=" class="square-image">
-            </div>
-            """, unsafe_allow_html=True)
-        with cols[1]:
-            st.markdown("""
-            <div class="image-container">
-                <img src="https://t3.ftcdn.net/jpg/05/68/27/22/360_F_568272234_QctXAHNIczaboEphLMQJ9fJ6c5WoSH9x.jpg" class="circular-image">
-            </div>
-            """, unsafe_allow_html=True)
-        
-        # Row 2
-        cols = st.columns(2)
-        with cols[0]:
-            st.markdown("""
-            <div class="image-container">
-                <img src="https://cdn.pixabay.com/photo/2024/03/20/04/00/ai-generated-8644565_640.jpg" class="circular-image">
-            </div>
-            """, unsafe_allow_html=True)
-        with cols[1]:
-            st.markdown("""
-            <div class="image-container">
-                <img src="https://t4.ftcdn.net/jpg/07/41/35/67/360_F_741356771_4d4HPQpxdSOKW6E1hfTgPMtWzUIX5C7K.jpg" class="square-image">
-            </div>
-            """, unsafe_allow_html=True)
-        
-        # Row 3
-        cols = st.columns(2)
-        with cols[0]:
-            st.markdown("""
-            <div class="image-container">
-                <img src="https://media.istockphoto.com/id/697805638/photo/indian-ayurvedic-dietary-supplement-called-chyawanprash-chyavanaprasha-is-a-cooked-mixture-of.jpg?s=1024x1024&w=is&k=20&c=eAhrqvy3fsDyIQS1mWpOF1BC-wZGQg6Ea3NwxHO68OE=" class="square-image">
-            </div>
-            """, unsafe_allow_html=True)
-        with cols[1]:
-            st.markdown("""
-            <div class="image-container">
-                <img src="https://media.istockphoto.com/id/946765682/photo/herb-and-spice-abstract-border.jpg?s=1024x1024&w=is&k=20&c=1fJoLGsDyutAwIbA2Ng4fZIKUEzzRqQY6PB8FvUh0Og=" class="circular-image">
-            </div>
-            """, unsafe_allow_html=True)
-        
-        st.markdown('</div>', unsafe_allow_html=True)
-
-    # Footer section
-    st.markdown("<div style='margin-top: 50px;'></div>", unsafe_allow_html=True)
-    if st.button("Consult Nearest Doctor", key="consult_button"):
-        st.markdown("[Click here to consult doctors](https://www.example.com/consult-doctors)", unsafe_allow_html=True)
-
-    st.markdown("---")
-    st.markdown("""
-    <div style='text-align: center; color: #000000;'>
-        © 2024 Vedabot | Built with ❤️ for Ayurveda and AI
-    </div>
-    """, unsafe_allow_html=True)
-
-if __name__ == "__main__":
-    main()
\ No newline at end of file
+
+    def __init__(self):
+        self.tokens = []
+        self.response = None
+        self._listeners = []
+
+    def publish(self, token):
+        self.tokens.append(token)
+        for listener in self._listeners:
+            listener.put_nowait(token)
+
+    def close(self, response):
+        self.response = response
+        for listener in self._listeners:
+            listener.put_nowait(None)
+
+    async def subscribe(self):
+        listener = asyncio.Queue()
+        for token in self.tokens:
+            listener.put_nowait(token)
+        if self.response is None:
+            self._listeners.append(listener)
+        else:
+            listener.put_nowait(None)
+        try:
+            while (token := await listener.get()) is not None:
+                yield token
+        finally:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+class QueryService:
+    """Asyncio query engine shared by every session in the process.
+
+    Embedding and FAISS search run in a thread pool, at most `max_inflight`
+    LLM calls are open at once, identical questions already in flight share
+    one upstream call (streamed ones share one token stream), and once
+    `max_queue` questions are waiting for an LLM slot new ones are turned
+    away with BUSY_MESSAGE instead of piling up.
+    The event loop runs on a background thread so synchronous callers such
+    as Streamlit sessions can use query() and stream().
+    """
+
+    def __init__(self, max_workers=8, max_inflight=8, max_queue=64):
+        self.max_queue = max_queue
+        self.stats = {"coalesced": 0, "rejected": 0}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="vedabot-query")
+        self._llm_slots = asyncio.Semaphore(max_inflight)
+        self._inflight = {}
+        self._streams = {}
+        self._waiting = 0
+        self._generating = 0
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="vedabot-loop", daemon=True).start()
+
+    def get_stats(self):
+        """Return queue depth, in-flight LLM calls and coalescing counters"""
+        return dict(self.stats, queue_depth=self._waiting, in_flight=self._generating)
+
+    async def _run(self, func, *args):
+        # run_in_executor doesn't carry contextvars over, so pass the trace along explicitly
+        call = functools.partial(contextvars.copy_context().run, func, *args)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+
+    async def _acquire_slot(self):
+        """Wait for an LLM slot, or return False if the queue is full"""
+        if self._waiting >= self.max_queue:
+            self.stats["rejected"] += 1
+            return False
+        self._waiting += 1
+        self._report()
+        try:
+            await self._llm_slots.acquire()
+        finally:
+            self._waiting -= 1
+        self._generating += 1
+        self._report()
+        return True
+
+    def _release_slot(self):
+        self._generating -= 1
+        self._llm_slots.release()
+        self._report()
+
+    def _report(self):
+        metrics.set_gauge("vedabot_query_queue_depth", self._waiting)
+        metrics.set_gauge("vedabot_llm_in_flight", self._generating)
+
+    def _coalesce_key(self, question, history, filter):
+        # Follow-ups only coalesce within the same conversation, and filtered questions with the same filter
+        key = (normalize_question(question), json.dumps(filter, sort_keys=True, default=list))
+        return key + tuple((turn["question"], turn.get("answer")) for turn in history)
+
+    def _joined(self):
+        self.stats["coalesced"] += 1
+        metrics.increment("vedabot_coalesced_queries_total")
+
+    async def _answer(self, question, history, filter):
+        start = time.perf_counter()
+        trace = metrics.start_trace()
+        try:
+            registry, cold, query, embedding, cached, docs = await self._run(_retrieve, question, history, filter)
+            if cached is not None:
+                return _complete(trace, start, cold, cached, cached.get("route", "cache"))
+            with metrics.span("queue_wait"):
+                acquired = await self._acquire_slot()
+            if not acquired:
+                return _finish_trace(trace, {"result": BUSY_MESSAGE}, "rejected")
+            try:
+                prompt = build_prompt(registry, question, query, docs, history)
+                with metrics.span("generate"):
+                    result = await registry["llm"].ainvoke(prompt)
+            finally:
+                self._release_slot()
+            response = {"query": question, "result": result, "source_documents": docs}
+            return await self._run(_complete, trace, start, cold, response, "llm",
+                                   None if filter else (query, embedding))
+        except Exception as e:
+            logging.error(f"[{trace.trace_id}] Error processing query: {str(e)}")
+            return _finish_trace(trace, {"result": ERROR_MESSAGE}, "error")
+
+    async def aquery(self, question, history=None, filter=None):
+        """Answer a question, sharing the upstream call with identical in-flight questions"""
+        history = history[-HISTORY_TURNS:] if history else []
+        key = self._coalesce_key(question, history, filter)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._answer(question, history, filter))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self._joined()
+        return await asyncio.shield(task)
+
+    async def astream(self, question, response, history=None, filter=None):
+        """Yield the answer to a question token by token, sharing one token stream with identical in-flight questions.
+
+        Once the generator is exhausted, `response` holds the same keys that
+        handle_query returns, including the source documents, so callers can
+        render references after the streamed answer.
+        """
+        history = history[-HISTORY_TURNS:] if history else []
+        key = self._coalesce_key(question, history, filter)
+        stream = self._streams.get(key)
+        if stream is None:
+            stream = _SharedStream()
+            self._streams[key] = stream
+            task = asyncio.ensure_future(self._generate_stream(stream, question, history, filter))
+            task.add_done_callback(lambda _: self._streams.pop(key, None))
+        else:
+            self._joined()
+        async for token in stream.subscribe():
+            yield token
+        response.update(stream.response)
+
+    async def _generate_stream(self, stream, question, history, filter):
+        """Stream one answer into a _SharedStream; runs to the end even if its callers go away"""
+        start = time.perf_counter()
+        trace = metrics.start_trace()
+        response = {}
+        try:
+            registry, cold, query, embedding, cached, docs = await self._run(_retrieve, question, history, filter)
+            if cached is not None:
+                _first_token_latencies.append(time.perf_counter() - start)
+                response.update(_complete(trace, start, cold, cached, cached.get("route", "cache")))
+                stream.publish(cached["result"])
+                return
+            with metrics.span("queue_wait"):
+                acquired = await self._acquire_slot()
+            if not acquired:
+                response["result"] = BUSY_MESSAGE
+                _finish_trace(trace, response, "rejected")
+                stream.publish(BUSY_MESSAGE)
+                return
+            try:
+                prompt = build_prompt(registry, question, query, docs, history)
+                tokens = []
+                with metrics.span("generate"):
+                    async for token in registry["llm"].astream(prompt):
+                        if not tokens:
+                            _first_token_latencies.append(time.perf_counter() - start)
+                        tokens.append(token)
+                        stream.publish(token)
+            finally:
+                self._release_slot()
+            response.update({"query": question, "result": "".join(tokens), "source_documents": docs})
+            await self._run(_complete, trace, start, cold, response, "llm", None if filter else (query, embedding))
+        except Exception as e:
+            logging.error(f"[{trace.trace_id}] Error processing query: {str(e)}")
+            response["result"] = ERROR_MESSAGE
+            _finish_trace(trace, response, "error")
+            stream.publish(ERROR_MESSAGE)
+        finally:
+            stream.close(response)
+
+    def query(self, question, timeout=None, history=None, filter=None):
+        """Blocking wrapper around aquery for synchronous callers"""
+        return asyncio.run_coroutine_threadsafe(self.aquery(question, history, filter), self._loop).result(timeout)
+
+    def stream(self, question, response, history=None, filter=None):
+        """Blocking generator wrapper around astream for synchronous callers"""
+        tokens = queue.Queue()
+        done = object()
+
+        async def pump():
+            try:
+                async for token in self.astream(question, response, history, filter):
+                    tokens.put(token)
+            finally:
+                tokens.put(done)
+
+        asyncio.run_coroutine_threadsafe(pump(), self._loop)
+        while (token := tokens.get()) is not done:
+            yield token
+
+_query_service = None
+_query_service_lock = threading.Lock()
+
+def get_query_service():
+    """Return the process-wide QueryService, starting it on first use"""
+    global _query_service
+    with _query_service_lock:
+        if _query_service is None:
+            _query_service = QueryService(
+                max_workers=QUERY_WORKERS,
+                max_inflight=MAX_INFLIGHT_LLM_CALLS,
+                max_queue=MAX_QUEUED_QUERIES,
+            )
+        return _query_service
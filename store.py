@@ -0,0 +1,220 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+import faiss
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from bm25 import BM25Index, write_postings
+
+INDEX_FILE = "index.faiss"
+CHUNKS_FILE = "chunks.sqlite"
+LEGACY_DOCSTORE_FILE = "index.pkl"
+SHARDS_DIR = "shards"
+LEGACY_SHARD = "all"  # name of a store saved before it was split into shards
+
+class SqliteChunks:
+    """Read-only access to the chunk table, one connection per thread"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            self._local.connection = connection
+        return connection
+
+class SqliteDocstore(Docstore):
+    """Docstore that fetches chunk text and metadata from SQLite on demand"""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+
+    def search(self, search):
+        row = self._chunks.connection.execute(
+            "SELECT id, text, metadata FROM chunks WHERE id = ?", (search,)
+        ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(id=row[0], page_content=row[1], metadata=json.loads(row[2]))
+
+class PositionMap(Mapping):
+    """Maps FAISS vector positions to chunk ids without loading them all"""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+
+    def __getitem__(self, position):
+        row = self._chunks.connection.execute(
+            "SELECT id FROM chunks WHERE position = ?", (int(position),)
+        ).fetchone()
+        if row is None:
+            raise KeyError(position)
+        return row[0]
+
+    def __iter__(self):
+        for (position,) in self._chunks.connection.execute("SELECT position FROM chunks ORDER BY position"):
+            yield position
+
+    def __len__(self):
+        return self._chunks.connection.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+def read_index(path):
+    """Read a FAISS index, memory-mapping its vectors where faiss supports it"""
+    if not hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+        logging.warning(f"faiss {faiss.__version__} can't memory-map indexes (needs faiss-cpu>=1.11), "
+                        f"reading {path} into RAM")
+        return faiss.read_index(path)
+    try:
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError as e:
+        # Index types without mmap support
+        logging.warning(f"Can't memory-map {path}, reading it into RAM: {str(e)}")
+        return faiss.read_index(path)
+
+def load_store(folder, embeddings):
+    """Open a saved store for querying.
+
+    Vectors are memory-mapped, so worker processes share the page cache, and
+    chunk texts are read from SQLite only for the hits a search returns.
+    Stores still in the pickle format written by FAISS.save_local are loaded
+    the old way.
+    """
+    chunks_path = os.path.join(folder, CHUNKS_FILE)
+    if not os.path.exists(chunks_path):
+        logging.warning(f"{folder} uses the legacy pickle format, re-run ingest.py --full to convert it")
+        return FAISS.load_local(folder, embeddings, allow_dangerous_deserialization=True)
+    chunks = SqliteChunks(chunks_path)
+    return FAISS(embeddings, read_index(os.path.join(folder, INDEX_FILE)),
+                 SqliteDocstore(chunks), PositionMap(chunks))
+
+def load_bm25(folder):
+    """Open the BM25 index saved with the store, or None if there is none"""
+    chunks_path = os.path.join(folder, CHUNKS_FILE)
+    if not os.path.exists(chunks_path):
+        return None
+    return BM25Index.load(SqliteChunks(chunks_path))
+
+def load_store_for_update(folder, embeddings):
+    """Load a saved store fully into memory so ingest can add and delete chunks"""
+    chunks_path = os.path.join(folder, CHUNKS_FILE)
+    if not os.path.exists(chunks_path):
+        return FAISS.load_local(folder, embeddings, allow_dangerous_deserialization=True)
+    documents, index_to_docstore_id = {}, {}
+    with sqlite3.connect(chunks_path) as connection:
+        for position, chunk_id, text, metadata in connection.execute(
+            "SELECT position, id, text, metadata FROM chunks ORDER BY position"
+        ):
+            documents[chunk_id] = Document(id=chunk_id, page_content=text, metadata=json.loads(metadata))
+            index_to_docstore_id[position] = chunk_id
+    index = faiss.read_index(os.path.join(folder, INDEX_FILE))
+    return FAISS(embeddings, index, InMemoryDocstore(documents), index_to_docstore_id)
+
+def save_store(db, folder):
+    """Write the index, chunk table and BM25 postings, swapping each file in atomically"""
+    os.makedirs(folder, exist_ok=True)
+    index_path = os.path.join(folder, INDEX_FILE)
+    chunks_path = os.path.join(folder, CHUNKS_FILE)
+
+    faiss.write_index(db.index, index_path + ".tmp")
+    if os.path.exists(chunks_path + ".tmp"):
+        os.remove(chunks_path + ".tmp")
+    with sqlite3.connect(chunks_path + ".tmp") as connection:
+        connection.execute(
+            "CREATE TABLE chunks (position INTEGER PRIMARY KEY, id TEXT UNIQUE, text TEXT, metadata TEXT)"
+        )
+        connection.executemany(
+            "INSERT INTO chunks VALUES (?, ?, ?, ?)",
+            (
+                (position, chunk_id, doc.page_content, json.dumps(doc.metadata))
+                for position, chunk_id in sorted(db.index_to_docstore_id.items())
+                for doc in [db.docstore.search(chunk_id)]
+            ),
+        )
+        write_postings(
+            connection,
+            ((position, db.docstore.search(chunk_id).page_content)
+             for position, chunk_id in db.index_to_docstore_id.items()),
+        )
+    connection.close()
+    os.replace(index_path + ".tmp", index_path)
+    os.replace(chunks_path + ".tmp", chunks_path)
+
+    legacy_path = os.path.join(folder, LEGACY_DOCSTORE_FILE)
+    if os.path.exists(legacy_path):
+        os.remove(legacy_path)
+
+def list_shards(folder):
+    """Map the name of every complete shard under folder to its directory.
+
+    A store saved before sharding is served as a single shard named
+    LEGACY_SHARD until the next ingest converts it.
+    """
+    root = os.path.join(folder, SHARDS_DIR)
+    shards = {}
+    if os.path.isdir(root):
+        for entry in sorted(os.scandir(root), key=lambda entry: entry.name):
+            # Skip a shard whose first save is still being written
+            if all(os.path.exists(os.path.join(entry.path, name)) for name in (INDEX_FILE, CHUNKS_FILE)):
+                shards[entry.name] = entry.path
+    if not shards and os.path.exists(os.path.join(folder, INDEX_FILE)):
+        shards[LEGACY_SHARD] = folder
+    return shards
+
+class ShardSet:
+    """The shards of a store, opened on first use and closed when idle.
+
+    At most max_loaded shards are open at once, least recently searched
+    closed first, and a shard not searched for idle_seconds is closed on the
+    next lookup, so a corpus that is rarely asked about doesn't hold on to
+    its mapped vectors and SQLite connections. prepare is applied to each
+    FAISS index as it is opened, e.g. to set nprobe.
+    """
+
+    def __init__(self, folder, embeddings, max_loaded=8, idle_seconds=1800, prepare=None):
+        self.paths = list_shards(folder)
+        self.embeddings = embeddings
+        self.max_loaded = max_loaded
+        self.idle_seconds = idle_seconds
+        self.prepare = prepare
+        self.stats = {"loads": 0, "unloads": 0}
+        self._loaded = OrderedDict()  # name -> (db, bm25, last used)
+        self._lock = threading.Lock()
+
+    @property
+    def names(self):
+        return list(self.paths)
+
+    @property
+    def loaded(self):
+        return list(self._loaded)
+
+    def get(self, name):
+        """Return the (FAISS store, BM25 index) of a shard, opening it if needed"""
+        with self._lock:
+            now = time.monotonic()
+            entry = self._loaded.pop(name, None)
+            if entry is None:
+                db = load_store(self.paths[name], self.embeddings)
+                if self.prepare is not None:
+                    self.prepare(db.index)
+                entry = (db, load_bm25(self.paths[name]), now)
+                self.stats["loads"] += 1
+                logging.info(f"Opened shard {name}")
+            for other, (_, _, used) in list(self._loaded.items()):
+                if now - used > self.idle_seconds or len(self._loaded) >= self.max_loaded:
+                    del self._loaded[other]
+                    self.stats["unloads"] += 1
+                    logging.info(f"Closed shard {other}")
+            self._loaded[name] = (entry[0], entry[1], now)
+            return entry[0], entry[1]
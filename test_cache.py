@@ -0,0 +1,25 @@
+import numpy as np
+from cache import AnswerCache
+
+def vector(i, dimension=16):
+    return np.random.default_rng(i).random(dimension).astype(np.float32)
+
+def test_mirror_stays_within_max_entries(tmp_path):
+    cache = AnswerCache(str(tmp_path / "cache.sqlite"), max_entries=10)
+    cache.bind({"index": 1})
+    for i in range(500):
+        cache.store(f"question {i}", vector(i), {"result": f"answer {i}"})
+        cache.lookup(f"question {i}", vector(i))
+    assert len(cache._embeddings) <= 10
+    assert cache.connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0] == 10
+    assert cache.lookup("question 499", vector(499))["result"] == "answer 499"
+    assert cache.lookup("question 0", vector(0)) is None
+
+def test_mirror_drops_rows_evicted_by_another_process(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    reader, writer = AnswerCache(path, max_entries=5), AnswerCache(path, max_entries=5)
+    reader.bind({"index": 1})
+    for i in range(50):
+        writer.store(f"question {i}", vector(i), {"result": f"answer {i}"})
+        reader.lookup("unrelated", vector(1000))
+    assert len(reader._embeddings) <= 5
@@ -0,0 +1,24 @@
+from conversation import condense_question, is_follow_up
+
+NAMES = {"triphala": "triphala", "ashwagandha": "ashwagandha", "amalaki": "amalaki", "amla": "amalaki"}
+HISTORY = [
+    {"question": "What helps back pain?", "answer": "Massage with warm oil."},
+    {"question": "Best herbs for headache", "answer": "Brahmi and Jatamansi."},
+]
+
+def test_questions_naming_their_own_herb_stand_alone():
+    for question in ["Dose of Triphala", "Benefits of Ashwagandha", "What is the dose of Amalaki?",
+                     "What is Triphala and how do I take it?",
+                     "Is Ashwagandha safe in pregnancy and what are its side effects?"]:
+        assert not is_follow_up(question, NAMES), question
+        assert condense_question(question, HISTORY, names=NAMES) == question
+
+def test_questions_without_a_subject_are_follow_ups():
+    for question in ["What about the dose?", "Is it safe?", "And for children?", "How much should I take?",
+                     "Can I give it to my dog?"]:
+        assert is_follow_up(question, NAMES), question
+    assert condense_question("Is it safe?", HISTORY, names=NAMES) == "Best herbs for headache Is it safe?"
+
+def test_reference_words_without_a_name_table():
+    assert not is_follow_up("What is Triphala and how do I take it?")
+    assert is_follow_up("What are its side effects?")
@@ -0,0 +1,98 @@
+import time
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+import llm_backends
+from llm_backends import CircuitBreaker, ResilientLLM
+
+class StubLLM(LLM):
+    """Backend answering `text`, after delays[i] seconds on its i-th call; calls listed in fail raise instead"""
+
+    text: str = "answer"
+    delays: list = []
+    fail: list = []
+    calls: int = 0
+
+    @property
+    def _llm_type(self):
+        return "stub"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        return "".join(chunk.text for chunk in self._stream(prompt, stop))
+
+    def _stream(self, prompt, stop=None, run_manager=None, **kwargs):
+        call = self.calls
+        self.calls += 1
+        time.sleep(self.delays[call] if call < len(self.delays) else 0.0)
+        if call in self.fail or self.fail == ["all"]:
+            raise ConnectionError(f"{self.text} is down")
+        for word in self.text.split():
+            yield GenerationChunk(text=word + " ")
+
+def resilient(*backends, **kwargs):
+    names = [f"backend{i}" for i in range(len(backends))]
+    return ResilientLLM(
+        backends=dict(zip(names, backends)),
+        breakers={name: CircuitBreaker(name, failures=kwargs.pop("failures", 5),
+                                       reset_seconds=kwargs.pop("reset_seconds", 60.0)) for name in names},
+        **kwargs,
+    )
+
+def test_hedge_wins_over_a_slow_primary():
+    llm = resilient(StubLLM(text="primary", delays=[1.0]), StubLLM(text="fallback"), hedge_after=0.1, deadline=5)
+    assert llm.invoke("q").strip() == "fallback"
+    assert llm.stats["hedged"] == 1 and llm.stats["hedge_wins"] == 1
+
+def test_failover_before_first_token():
+    primary, fallback = StubLLM(text="primary", fail=["all"]), StubLLM(text="fallback")
+    llm = resilient(primary, fallback, hedge_after=1.0, deadline=5)
+    assert "".join(llm.stream("q")).strip() == "fallback"
+    assert primary.calls == 1 and llm.stats["fallbacks"] == 1 and llm.stats["retries"] == 0
+
+def test_retry_after_a_full_round(monkeypatch):
+    monkeypatch.setattr(llm_backends, "RETRY_BASE_DELAY", 0.01)
+    primary, fallback = StubLLM(text="primary", fail=[0]), StubLLM(text="fallback", fail=[0])
+    llm = resilient(primary, fallback, hedge_after=1.0, deadline=5)
+    assert llm.invoke("q").strip() == "primary"
+    assert llm.stats["retries"] == 1 and primary.calls == 2
+
+def test_request_after_failover_is_hedged():
+    fallback = StubLLM(text="fallback", delays=[1.0])
+    llm = resilient(StubLLM(text="primary", fail=["all"]), fallback, hedge_after=0.1, deadline=5)
+    assert llm.invoke("q").strip() == "fallback"
+    assert llm.stats["hedged"] == 1 and llm.stats["hedge_wins"] == 1 and fallback.calls == 2
+
+def test_breaker_opens_half_opens_and_closes():
+    breaker = CircuitBreaker("stub", failures=2, reset_seconds=0.1)
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    time.sleep(0.15)
+    assert breaker.state == "half-open"
+    assert breaker.allow() and not breaker.allow()  # a single trial request
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    time.sleep(0.15)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+def test_breaker_trial_that_never_finishes_counts_as_failure():
+    breaker = CircuitBreaker("stub", failures=1, reset_seconds=0.1, trial_timeout=0.1)
+    breaker.record_failure()
+    time.sleep(0.15)
+    assert breaker.allow()
+    time.sleep(0.15)
+    assert not breaker.allow() and breaker.state == "open"
+    time.sleep(0.15)
+    assert breaker.allow()
+
+def test_open_breaker_sends_traffic_to_the_fallback():
+    primary = StubLLM(text="primary", fail=[0])
+    llm = resilient(primary, StubLLM(text="fallback"), hedge_after=1.0, deadline=5, failures=1, reset_seconds=0.2)
+    assert llm.invoke("q").strip() == "fallback"
+    assert llm.get_stats()["breakers"]["backend0"] == "open"
+    assert llm.invoke("q").strip() == "fallback" and primary.calls == 1
+    time.sleep(0.25)
+    assert llm.invoke("q").strip() == "primary"
+    assert llm.get_stats()["breakers"]["backend0"] == "closed"
@@ -0,0 +1,53 @@
+import pytest
+from lookup import LookupIndex, fix_glyphs, write_lookup
+
+SECTIONS = {
+    "API-Vol-1.pdf": [
+        ("API-Vol-1", "GUDUCI", "SYNONYMS", 41, "API-Vol-1.pdf", "API-Vol-1",
+         "SYNONYMS\nSanskrit : Amṛtā, Chinnaruhā\nEnglish : Heart-leaved Moonseed"),
+        ("API-Vol-1", "GUDUCI", "DOSE", 42, "API-Vol-1.pdf", "API-Vol-1", "DOSE - 20-30 g of the drug for decoction"),
+        ("API-Vol-1", "GUDUCI", "PROPERTIES AND ACTION", 42, "API-Vol-1.pdf", "API-Vol-1",
+         "PROPERTIES AND ACTION\nRasa : Tikta, Ka¿¡ya\nKarma : Ras¡yana\nGuna : Guru, Snigdha"),
+        ("API-Vol-1", "AMALAKI", "DOSE", 5, "API-Vol-1.pdf", "API-Vol-1", "DOSE - 3-6 g of the drug in powder form"),
+        ("API-Vol-1", "AMALAKI", "THERAPEUTIC USES", 5, "API-Vol-1.pdf", "API-Vol-1",
+         "THERAPEUTIC USES - Amlapitta, Prameha, Raktapitta¬"),
+    ],
+}
+
+@pytest.fixture
+def index(tmp_path):
+    path = str(tmp_path / "lookup.sqlite")
+    write_lookup(path, SECTIONS)
+    return LookupIndex(path)
+
+@pytest.mark.parametrize("question, expected", [
+    ("dose of amalaki", ("amalaki", "dose")),
+    ("What is the recommended daily dosage of Amalaki?", ("amalaki", "dose")),
+    ("Tell me the properties of Guduci", ("guduci", "properties")),
+    ("How much Amṛtā per day?", ("guduci", "dose")),
+])
+def test_plain_lookups_match(index, question, expected):
+    assert index.match(question) == expected
+
+@pytest.mark.parametrize("question", [
+    "dose of amalaki for children",  # a word that may change the answer
+    "dose and uses of amalaki",  # two intents
+    "dose of amalaki and guduci",  # two herbs
+    "what is the dose",  # no herb
+    "tell me about amalaki",  # no intent
+    "dose of ashwagandha",  # an unknown herb
+])
+def test_other_questions_are_left_to_the_llm(index, question):
+    assert index.match(question) is None
+
+def test_answer_maps_legacy_glyphs(index):
+    response = index.answer("properties of guduci")
+    assert response["result"].startswith("#### GUDUCI")
+    assert "Kaśāya" in response["result"] and "Rasāyana" in response["result"]
+
+def test_answer_with_unknown_glyphs_is_left_to_the_llm(index):
+    assert index.answer("uses of amalaki") is None
+
+def test_fix_glyphs():
+    assert fix_glyphs("Ras¡µjana 25µg at 40°C, J¡t¢k°À¡") == "Rasāñjana 25µg at 40°C, Jātīkoṣā"
+    assert fix_glyphs("Tikta¬") is None
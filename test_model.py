@@ -1,4 +1,4 @@
-from model import handle_query
+from model import handle_query, warm_up, get_query_metrics
 
 def test_model():
     # Sample queries to test the functionality
@@ -7,7 +7,9 @@ def test_model():
         "What precautions should I take when using Tulsi for cold?",
         "What are the benefits of Ashwagandha?",
     ]
-    
+
+    warm_up()
+
     for query in queries:
         print(f"Query: {query}")
         print("Response:")
@@ -18,5 +20,7 @@ def test_model():
             print(f"Error: {e}")
         print("\n" + "-"*80 + "\n")
 
+    print(f"Query latency: {get_query_metrics()}")
+
 if __name__ == "__main__":
     test_model()